@@ -1,37 +1,25 @@
 #!/usr/bin/env python3
 
-import json
+import argparse
+import gzip
+import logging
 import os
-import re
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from src.slack_client import TownCrierSlackClient
+from src import json_utils
+from src.collector import PROGRESS_BARS, collect_channel, referenced_user_ids
+from src.slack_client import HISTORY_PAGE_SIZE, TownCrierSlackClient, slim_message
 
-def resolve_user_mentions(text, user_cache, client=None):
-    """Replace <@USER_ID> mentions with user names"""
-    if not text:
-        return text
-    
-    # Find all user mentions in the format <@USER_ID>
-    user_mentions = re.findall(r'<@(U[A-Z0-9]+)>', text)
-    
-    for user_id in user_mentions:
-        # If user not in cache and we have a client, fetch user info
-        if user_id not in user_cache and client:
-            try:
-                print(f"    🔍 Looking up mentioned user: {user_id}")
-                user_info = client.get_user_info(user_id)
-                user_cache[user_id] = user_info
-            except Exception as e:
-                print(f"    ❌ Failed to lookup user {user_id}: {e}")
-                continue
-        
-        if user_id in user_cache:
-            user_name = user_cache[user_id].get('display_name') or user_cache[user_id].get('real_name') or user_cache[user_id].get('name')
-            if user_name and user_name != 'Unknown':
-                text = text.replace(f'<@{user_id}>', f'@{user_name}')
-    
-    return text
+log = logging.getLogger(__name__)
+
+# Number of channels fetched concurrently
+MAX_WORKERS = 8
+
+# Finished channels are appended here (one JSON object per line) until the run completes
+CHECKPOINT_FILENAME = "complete_history.partial.ndjson"
+
+# Force the checkpoint to disk every N channels
+CHECKPOINT_EVERY = 5
 
 def collect_all_history():
     print("=== TownCrier Complete Historical Collection ===\n")
@@ -54,151 +42,96 @@ def collect_all_history():
     print("\nFinding all accessible channels...")
     channels = client.get_all_accessible_channels()
     
-    # Initialize user cache for resolving user IDs to names
-    user_cache = {}
-    print(f"\nInitializing user cache...")
+    print("\nInitializing user cache...")
+    # Fetch every user up front for resolving user IDs to names
+    user_cache = client.prefetch_all_users()
     
-    # Collect messages from all accessible channels
-    all_data = {
-        "collection_time": datetime.now().isoformat(),
-        "collection_type": "complete_history",
-        "channels": {}
-    }
+    # Each channel is appended to the checkpoint as soon as it completes, so only the
+    # channels in flight are held in memory and an interrupted run can pick up where
+    # it left off instead of re-spending API quota on finished channels
+    completed, referenced = resume_checkpoint(CHECKPOINT_FILENAME, {channel['name'] for channel in channels})
+    if completed:
+        print(f"\n♻️  Resuming: {len(completed)} channels already collected in {CHECKPOINT_FILENAME}")
     
-    accessible_count = 0
+    accessible_count = len(completed)
     inaccessible_count = 0
-    total_messages = 0
+    total_messages = sum(completed.values())
+    
+    pending_channels = [channel for channel in channels if channel['name'] not in completed]
     
-    print(f"\nCollecting ALL HISTORICAL messages from {len(channels)} channels...")
+    print(f"\nCollecting ALL HISTORICAL messages from {len(pending_channels)} channels ({MAX_WORKERS} at a time)...")
     print("=" * 70)
     
-    for i, channel in enumerate(channels, 1):
-        channel_name = channel['name']
-        channel_id = channel['id']
-        
-        try:
-            # Progress bar
-            progress = "█" * (i * 20 // len(channels)) + "░" * (20 - (i * 20 // len(channels)))
-            print(f"[{progress}] {i:2d}/{len(channels)} 📥 {channel_name}...", end=" ")
-            
-            # Get ALL channel history (no time limit)
-            messages = get_complete_channel_history(client, channel_id)
-            
-            # Process messages to extract useful info and collect threaded replies
-            processed_messages = []
-            thread_replies_count = 0
+    def fetch_complete_history(channel_id):
+        return get_complete_channel_history(client, channel_id)
+    
+    n_channels = len(channels)
+    with open(CHECKPOINT_FILENAME, 'ab') as checkpoint:
+        # Channels are independent, so fetch them concurrently and report as each one finishes
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {
+                executor.submit(collect_channel, client, channel, user_cache, fetch_complete_history): channel
+                for channel in pending_channels
+            }
             
-            for msg in messages:
-                msg_text = msg.get('text', '')
-                user_id = msg.get('user')
-                
-                # Resolve user ID to name and cache it
-                user_name = None
-                if user_id and user_id not in user_cache:
-                    print(f"\n    🔍 Looking up user: {user_id}")
-                    user_info = client.get_user_info(user_id)
-                    user_cache[user_id] = user_info
-                
-                if user_id and user_id in user_cache:
-                    user_info = user_cache[user_id]
-                    user_name = user_info.get('display_name') or user_info.get('real_name') or user_info.get('name')
-                
-                # Replace user mentions in message text
-                resolved_text = resolve_user_mentions(msg_text, user_cache, client)
-                
-                msg_head = resolved_text[:100] + "..." if len(resolved_text) > 100 else resolved_text
-                if len(msg_text) > 100:  # Only print for longer messages to reduce spam
-                    print(f"\n    📄 Message head: {repr(msg_head)}")
-                
-                processed_msg = {
-                    "timestamp": msg.get('ts'),
-                    "user_id": user_id,
-                    "user_name": user_name or "Unknown",
-                    "text": resolved_text,
-                    "type": msg.get('type'),
-                    "subtype": msg.get('subtype'),
-                    "thread_ts": msg.get('thread_ts'),
-                    "reply_count": msg.get('reply_count', 0),
-                    "replies": []
-                }
-                
-                # Check if this message has replies (it's a thread parent)
-                reply_count = msg.get('reply_count', 0)
-                
-                # Fetch replies for any message that has replies
-                if reply_count > 0:
-                    print(f"\n    FETCHING {reply_count} replies for thread...")
-                    thread_replies = client.get_thread_replies(channel_id, msg.get('ts'))
+            try:
+                for i, future in enumerate(as_completed(futures), len(completed) + 1):
+                    # Drop our reference to the future so its result can be freed once written
+                    channel_name = futures.pop(future)['name']
+                    channel_data = future.result()
+                    referenced |= referenced_user_ids(channel_data)
                     
-                    processed_replies = []
-                    for reply in thread_replies:
-                        reply_text = reply.get('text', '')
-                        reply_user_id = reply.get('user')
-                        
-                        # Resolve reply user ID to name and cache it
-                        reply_user_name = None
-                        if reply_user_id and reply_user_id not in user_cache:
-                            print(f"      🔍 Looking up reply user: {reply_user_id}")
-                            user_info = client.get_user_info(reply_user_id)
-                            user_cache[reply_user_id] = user_info
-                        
-                        if reply_user_id and reply_user_id in user_cache:
-                            user_info = user_cache[reply_user_id]
-                            reply_user_name = user_info.get('display_name') or user_info.get('real_name') or user_info.get('name')
-                        
-                        # Replace user mentions in reply text
-                        resolved_reply_text = resolve_user_mentions(reply_text, user_cache, client)
-                        
-                        processed_reply = {
-                            "timestamp": reply.get('ts'),
-                            "user_id": reply_user_id,
-                            "user_name": reply_user_name or "Unknown",
-                            "text": resolved_reply_text,
-                            "type": reply.get('type'),
-                            "subtype": reply.get('subtype'),
-                            "thread_ts": reply.get('thread_ts')
-                        }
-                        processed_replies.append(processed_reply)
+                    checkpoint.write(json_utils.dumps({channel_name: channel_data}) + b'\n')
+                    if i % CHECKPOINT_EVERY == 0:
+                        checkpoint.flush()
+                        os.fsync(checkpoint.fileno())
                     
-                    processed_msg["replies"] = processed_replies
-                    thread_replies_count += len(processed_replies)
-                
-                processed_messages.append(processed_msg)
-            
-            all_data["channels"][channel_name] = {
-                "id": channel_id,
-                "message_count": len(messages),
-                "thread_replies_count": thread_replies_count,
-                "messages": processed_messages
-            }
-            
-            accessible_count += 1
-            total_messages += len(messages) + thread_replies_count
-            
-            if thread_replies_count > 0:
-                print(f"\n✅ {len(messages)} messages + {thread_replies_count} replies")
-            else:
-                print(f"\n✅ {len(messages)} messages")
-            
-        except Exception as e:
-            if "not_in_channel" in str(e):
-                print("\n❌ Bot not in channel")
-                all_data["channels"][channel_name] = {
-                    "id": channel_id,
-                    "error": "bot_not_in_channel",
-                    "message_count": 0,
-                    "messages": []
-                }
-                inaccessible_count += 1
-            else:
-                print(f"\n❌ Error: {str(e)}")
-                all_data["channels"][channel_name] = {
-                    "id": channel_id,
-                    "error": str(e),
-                    "message_count": 0,
-                    "messages": []
-                }
-                inaccessible_count += 1
+                    # Progress bar
+                    progress = PROGRESS_BARS[i * 20 // n_channels]
+                    print(f"\n[{progress}] {i:2d}/{n_channels} 📥 {channel_name}...", end=" ")
+                    
+                    if channel_data.get('error') == "bot_not_in_channel":
+                        print("❌ Bot not in channel")
+                        inaccessible_count += 1
+                    elif channel_data.get('error'):
+                        print(f"❌ Error: {channel_data['error']}")
+                        inaccessible_count += 1
+                    else:
+                        message_count = channel_data['message_count']
+                        thread_replies_count = channel_data['thread_replies_count']
+                        accessible_count += 1
+                        total_messages += message_count + thread_replies_count
+                        
+                        if thread_replies_count > 0:
+                            print(f"✅ {message_count} messages + {thread_replies_count} replies")
+                        else:
+                            print(f"✅ {message_count} messages")
+            except BaseException:
+                # On Ctrl-C (or an error) drop the channels not yet started instead of letting
+                # the pool's exit fetch every one of them only for the results to be discarded
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    
+    # Save to main folder. The dump is gzipped since it is large and highly
+    # repetitive; read it back with gzip.open().
+    filename = f"complete_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json.gz"
+    
+    with gzip.open(filename, 'wb', compresslevel=3) as f, open(CHECKPOINT_FILENAME, 'rb') as checkpoint:
+        f.write(b'{"collection_time":' + json_utils.dumps(datetime.now().isoformat()))
+        f.write(b',"collection_type":"complete_history","channels":{')
+        
+        # Each checkpoint line is a one-key object, so its inner text is a ready-made
+        # "name":{...} member of the channels object
+        for line_number, line in enumerate(checkpoint):
+            if line_number > 0:
+                f.write(b',')
+            f.write(line.rstrip(b'\n')[1:-1])
+        
+        # Add the users the collection refers to, not the whole workspace directory
+        user_cache = {user_id: user_cache[user_id] for user_id in sorted(referenced) if user_id in user_cache}
+        f.write(b'},"user_cache":' + json_utils.dumps(user_cache) + b'}')
+    
+    os.remove(CHECKPOINT_FILENAME)
     
     print("=" * 70)
     print(f"Historical collection complete!")
@@ -206,23 +139,43 @@ def collect_all_history():
     print(f"❌ Inaccessible channels: {inaccessible_count}")
     print(f"📊 Total messages collected: {total_messages}")
     print(f"👥 Users resolved: {len(user_cache)}")
-    
-    # Add user cache to data
-    all_data["user_cache"] = user_cache
-    
-    # Save to main folder
-    filename = f"complete_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(all_data, f, indent=2, ensure_ascii=False)
-    
     print(f"💾 Complete history saved to: {filename}")
     
-    return all_data
+    return filename
+
+def resume_checkpoint(path, channel_names):
+    """
+    Keep only the successfully collected channels from an interrupted run's checkpoint
+    that are still in `channel_names`. Returns {channel_name: messages + replies
+    collected} for each of them, and the IDs of the users those channels refer to.
+    """
+    completed = {}
+    referenced = set()
+    if not os.path.exists(path):
+        return completed, referenced
+    
+    # Rewrite without failed channels (so they are retried), channels no longer listed
+    # (archived, renamed or left since the crash) or a torn final line
+    temp_path = path + ".tmp"
+    with open(path, 'rb') as source, open(temp_path, 'wb') as kept:
+        for line in source:
+            try:
+                ((channel_name, channel_data),) = json_utils.loads(line).items()
+            except ValueError:
+                continue
+            if channel_data.get('error') or channel_name not in channel_names:
+                continue
+            completed[channel_name] = channel_data['message_count'] + channel_data['thread_replies_count']
+            referenced |= referenced_user_ids(channel_data)
+            kept.write(line.rstrip(b'\n') + b'\n')
+    os.replace(temp_path, path)
+    
+    return completed, referenced
 
 def get_complete_channel_history(client, channel_id):
     """Get ALL messages from a channel with no time limit"""
     try:
-        print(f"\n    Fetching complete history for channel...")
+        log.debug("    Fetching complete history for channel %s...", channel_id)
         
         all_messages = []
         cursor = None
@@ -230,51 +183,35 @@ def get_complete_channel_history(client, channel_id):
         
         while True:
             page_count += 1
-            time.sleep(30)  # Rate limiting before API call
             
             # Build API call parameters
             params = {
                 'channel': channel_id,
-                'limit': 15  # Current Slack API limit per request
+                'limit': HISTORY_PAGE_SIZE
             }
             
             if cursor:
                 params['cursor'] = cursor
             
-            print(f"\n      Page {page_count}: requesting up to {params['limit']} messages...")
+            log.debug("      Page %d: requesting up to %d messages...", page_count, params['limit'])
             
-            # Retry logic for rate limits
-            max_retries = 3
-            for retry in range(max_retries):
-                try:
-                    response = client.client.conversations_history(**params)
-                    break  # Success, exit retry loop
-                except Exception as e:
-                    if 'rate_limited' in str(e):
-                        retry_after = 120  # Default retry time
-                        print(f"\n      Rate limited, retrying in {retry_after} seconds (attempt {retry + 1}/{max_retries})...")
-                        time.sleep(retry_after)
-                    else:
-                        raise  # Re-raise non-rate-limit errors
-            else:
-                # All retries exhausted
-                raise Exception("Rate limit retries exhausted")
+            response = client.call_api('conversations.history', **params)
             
-            page_messages = response['messages']
+            page_messages = [slim_message(msg) for msg in response['messages']]
             all_messages.extend(page_messages)
             
-            print(f"\n      Page {page_count}: got {len(page_messages)} messages (total: {len(all_messages)})")
+            log.debug("      Page %d: got %d messages (total: %d)", page_count, len(page_messages), len(all_messages))
             
             # Check if we have more pages
             if not response.get('has_more', False):
-                print(f"\n      Reached end of channel history")
+                log.debug("      Reached end of channel history")
                 break
                 
             cursor = response.get('response_metadata', {}).get('next_cursor')
             if not cursor:
                 break
         
-        print(f"\n    Found {len(all_messages)} total messages in channel")
+        log.debug("    Found %d total messages in channel", len(all_messages))
         
         return all_messages
         
@@ -283,4 +220,9 @@ def get_complete_channel_history(client, channel_id):
         raise
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Collect the complete message history of all accessible channels')
+    parser.add_argument('--verbose', action='store_true', help='Log every message and reply as it is processed')
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(message)s")
     collect_all_history()
\ No newline at end of file
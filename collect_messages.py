@@ -1,37 +1,17 @@
 #!/usr/bin/env python3
 
-import json
+import argparse
+import logging
 import os
-import re
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from src import json_utils
+from src.collector import PROGRESS_BARS, collect_channel, referenced_user_ids
 from src.slack_client import TownCrierSlackClient
 
-def resolve_user_mentions(text, user_cache, client=None):
-    """Replace <@USER_ID> mentions with user names"""
-    if not text:
-        return text
-    
-    # Find all user mentions in the format <@USER_ID>
-    user_mentions = re.findall(r'<@(U[A-Z0-9]+)>', text)
-    
-    for user_id in user_mentions:
-        # If user not in cache and we have a client, fetch user info
-        if user_id not in user_cache and client:
-            try:
-                print(f"    🔍 Looking up mentioned user: {user_id}")
-                user_info = client.get_user_info(user_id)
-                user_cache[user_id] = user_info
-            except Exception as e:
-                print(f"    ❌ Failed to lookup user {user_id}: {e}")
-                continue
-        
-        if user_id in user_cache:
-            user_name = user_cache[user_id].get('display_name') or user_cache[user_id].get('real_name') or user_cache[user_id].get('name')
-            if user_name and user_name != 'Unknown':
-                text = text.replace(f'<@{user_id}>', f'@{user_name}')
-    
-    return text
+# Number of channels fetched concurrently
+MAX_WORKERS = 8
 
 def collect_all_messages():
     print("=== TownCrier Message Collection ===\n")
@@ -47,9 +27,9 @@ def collect_all_messages():
     print("\nFinding all accessible channels...")
     channels = client.get_all_accessible_channels()
     
-    # Initialize user cache for resolving user IDs to names
-    user_cache = {}
     print("\nInitializing user cache...")
+    # Fetch every user up front for resolving user IDs to names
+    user_cache = client.prefetch_all_users()
     
     # Collect messages from all accessible channels
     all_data = {
@@ -61,141 +41,69 @@ def collect_all_messages():
     inaccessible_count = 0
     total_messages = 0
     
-    print(f"\nCollecting messages from {len(channels)} channels...")
+    print(f"\nCollecting messages from {len(channels)} channels ({MAX_WORKERS} at a time)...")
     print("=" * 50)
     
-    for i, channel in enumerate(channels, 1):
-        channel_name = channel['name']
-        channel_id = channel['id']
+    # Each channel is also appended to an NDJSON file ({name: data} per line) as it
+    # finishes, so step 2 can stream channels instead of loading the whole collection.
+    # It is written as .partial and only renamed once collection completes, so an
+    # interrupted run never leaves a truncated file for the summarizers to pick up.
+    os.makedirs("data", exist_ok=True)
+    file_stem = f"data/messages_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    
+    def fetch_last_week(channel_id):
+        return client.get_channel_history(channel_id, days=7)
+    
+    n_channels = len(channels)
+    # Channels are independent, so fetch them concurrently and report as each one finishes
+    channel_results = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, open(f"{file_stem}.ndjson.partial", 'wb') as ndjson_file:
+        futures = {
+            executor.submit(collect_channel, client, channel, user_cache, fetch_last_week): channel
+            for channel in channels
+        }
         
         try:
-            # Progress bar
-            progress = "█" * (i * 20 // len(channels)) + "░" * (20 - (i * 20 // len(channels)))
-            print(f"[{progress}] {i:2d}/{len(channels)} 📥 {channel_name}...", end=" ")
-            messages = client.get_channel_history(channel_id, days=7)
-            
-            # Process messages to extract useful info and collect threaded replies
-            processed_messages = []
-            thread_replies_count = 0
-            
-            for msg in messages:
-                msg_text = msg.get('text', '')
-                user_id = msg.get('user')
-                
-                # Resolve user ID to name and cache it
-                user_name = None
-                if user_id and user_id not in user_cache:
-                    print(f"    🔍 Looking up user: {user_id}")
-                    user_info = client.get_user_info(user_id)
-                    user_cache[user_id] = user_info
-                
-                if user_id and user_id in user_cache:
-                    user_info = user_cache[user_id]
-                    user_name = user_info.get('display_name') or user_info.get('real_name') or user_info.get('name')
-                
-                # Replace user mentions in message text
-                resolved_text = resolve_user_mentions(msg_text, user_cache, client)
-                
-                msg_head = resolved_text[:100] + "..." if len(resolved_text) > 100 else resolved_text
-                print(f"    📄 Message head: {repr(msg_head)}")
+            for i, future in enumerate(as_completed(futures), 1):
+                channel_name = futures[future]['name']
+                channel_data = future.result()
+                channel_results[channel_name] = channel_data
+                ndjson_file.write(json_utils.dumps({channel_name: channel_data}) + b'\n')
                 
-                processed_msg = {
-                    "timestamp": msg.get('ts'),
-                    "user_id": user_id,
-                    "user_name": user_name or "Unknown",
-                    "text": resolved_text,
-                    "type": msg.get('type'),
-                    "subtype": msg.get('subtype'),
-                    "thread_ts": msg.get('thread_ts'),
-                    "reply_count": msg.get('reply_count', 0),
-                    "replies": []
-                }
+                # Progress bar
+                progress = PROGRESS_BARS[i * 20 // n_channels]
+                print(f"[{progress}] {i:2d}/{n_channels} 📥 {channel_name}...", end=" ")
                 
-                # Check if this message has replies (it's a thread parent)
-                reply_count = msg.get('reply_count', 0)
-                has_thread_ts = msg.get('thread_ts')
-                
-                print(f"    DEBUG: reply_count={reply_count}, thread_ts={has_thread_ts}")
-                
-                # Fetch replies for any message that has replies
-                if reply_count > 0:
-                    print(f"    FETCHING replies for parent message: {msg.get('text', '')[:50]}...")
-                    # This is the parent message of a thread
-                    thread_replies = client.get_thread_replies(channel_id, msg.get('ts'))
-                    print(f"    Got {len(thread_replies)} replies")
-                    
-                    processed_replies = []
-                    for reply in thread_replies:
-                        reply_text = reply.get('text', '')
-                        reply_user_id = reply.get('user')
-                        
-                        # Resolve reply user ID to name and cache it
-                        reply_user_name = None
-                        if reply_user_id and reply_user_id not in user_cache:
-                            print(f"      🔍 Looking up reply user: {reply_user_id}")
-                            user_info = client.get_user_info(reply_user_id)
-                            user_cache[reply_user_id] = user_info
-                        
-                        if reply_user_id and reply_user_id in user_cache:
-                            user_info = user_cache[reply_user_id]
-                            reply_user_name = user_info.get('display_name') or user_info.get('real_name') or user_info.get('name')
-                        
-                        # Replace user mentions in reply text
-                        resolved_reply_text = resolve_user_mentions(reply_text, user_cache, client)
-                        
-                        reply_head = resolved_reply_text[:100] + "..." if len(resolved_reply_text) > 100 else resolved_reply_text
-                        print(f"      🧵 Reply head: {repr(reply_head)}")
-                        
-                        processed_reply = {
-                            "timestamp": reply.get('ts'),
-                            "user_id": reply_user_id,
-                            "user_name": reply_user_name or "Unknown",
-                            "text": resolved_reply_text,
-                            "type": reply.get('type'),
-                            "subtype": reply.get('subtype'),
-                            "thread_ts": reply.get('thread_ts')
-                        }
-                        processed_replies.append(processed_reply)
+                if channel_data.get('error') == "bot_not_in_channel":
+                    print("❌ Bot not in channel")
+                    inaccessible_count += 1
+                elif channel_data.get('error'):
+                    print(f"❌ Error: {channel_data['error']}")
+                    inaccessible_count += 1
+                else:
+                    message_count = channel_data['message_count']
+                    thread_replies_count = channel_data['thread_replies_count']
+                    accessible_count += 1
+                    total_messages += message_count + thread_replies_count
                     
-                    processed_msg["replies"] = processed_replies
-                    thread_replies_count += len(processed_replies)
-                
-                processed_messages.append(processed_msg)
-            
-            all_data["channels"][channel_name] = {
-                "id": channel_id,
-                "message_count": len(messages),
-                "thread_replies_count": thread_replies_count,
-                "messages": processed_messages
-            }
-            
-            accessible_count += 1
-            total_messages += len(messages) + thread_replies_count
-            
-            if thread_replies_count > 0:
-                print(f"✅ {len(messages)} messages + {thread_replies_count} replies")
-            else:
-                print(f"✅ {len(messages)} messages")
-            
-        except Exception as e:
-            if "not_in_channel" in str(e):
-                print("❌ Bot not in channel")
-                all_data["channels"][channel_name] = {
-                    "id": channel_id,
-                    "error": "bot_not_in_channel",
-                    "message_count": 0,
-                    "messages": []
-                }
-                inaccessible_count += 1
-            else:
-                print(f"❌ Error: {str(e)}")
-                all_data["channels"][channel_name] = {
-                    "id": channel_id,
-                    "error": str(e),
-                    "message_count": 0,
-                    "messages": []
-                }
-                inaccessible_count += 1
+                    if thread_replies_count > 0:
+                        print(f"✅ {message_count} messages + {thread_replies_count} replies")
+                    else:
+                        print(f"✅ {message_count} messages")
+        except BaseException:
+            # On Ctrl-C (or an error) drop the channels not yet started instead of letting
+            # the pool's exit fetch every one of them only for the results to be discarded
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    
+    # Keep the output in the same channel order Slack returned
+    referenced = set()
+    for channel in channels:
+        all_data["channels"][channel['name']] = channel_results[channel['name']]
+        referenced |= referenced_user_ids(channel_results[channel['name']])
+    
+    # Only the users this collection refers to, not the whole workspace directory
+    user_cache = {user_id: user_cache[user_id] for user_id in sorted(referenced) if user_id in user_cache}
     
     print("=" * 50)
     print(f"Collection complete!")
@@ -208,14 +116,19 @@ def collect_all_messages():
     all_data["user_cache"] = user_cache
     
     # Save to file in data folder
-    os.makedirs("data", exist_ok=True)
-    filename = f"data/messages_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(all_data, f, indent=2, ensure_ascii=False)
+    filename = f"{file_stem}.json"
+    json_utils.dump_file(all_data, filename, indent=True)
+    os.replace(f"{file_stem}.ndjson.partial", f"{file_stem}.ndjson")
     
     print(f"💾 Data saved to: {filename}")
+    print(f"💾 Channels streamed to: {file_stem}.ndjson")
     
     return all_data
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Collect the last 7 days of messages from all accessible channels')
+    parser.add_argument('--verbose', action='store_true', help='Log every message and reply as it is processed')
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(message)s")
     collect_all_messages()
\ No newline at end of file
@@ -1,52 +1,66 @@
 #!/usr/bin/env python3
 
 import os
-import json
 import requests
 import argparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
 
-def find_most_recent_json(data_dir="data"):
-    """Find the most recently modified JSON file in the data directory."""
-    data_path = Path(data_dir)
-    if not data_path.exists():
+# Number of files posted concurrently with --all
+MAX_WORKERS = 4
+
+# Shared session so repeated posts reuse the same keep-alive connections
+session = requests.Session()
+session.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=MAX_WORKERS,
+    # raise_on_status=False hands the last response back once retries run out, so a
+    # persistent error is reported by its status code rather than raised
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503], allowed_methods=['POST'], raise_on_status=False)
+))
+session.headers.update({'Content-Type': 'application/json'})
+
+def scan_json_files(data_dir):
+    """List JSON files in the data directory as DirEntry objects, which cache their stat() result."""
+    if not os.path.isdir(data_dir):
         raise FileNotFoundError(f"Data directory '{data_dir}' not found")
     
-    json_files = list(data_path.glob("*.json"))
-    if not json_files:
+    with os.scandir(data_dir) as entries:
+        json_entries = [entry for entry in entries if entry.name.endswith(".json") and entry.is_file()]
+    if not json_entries:
         raise FileNotFoundError("No JSON files found in data directory")
     
-    # Sort by modification time, most recent first
-    most_recent = max(json_files, key=os.path.getmtime)
-    return most_recent
+    return json_entries
+
+def find_most_recent_json(data_dir="data"):
+    """Find the most recently modified JSON file in the data directory."""
+    json_entries = scan_json_files(data_dir)
+    
+    most_recent = max(json_entries, key=lambda entry: entry.stat().st_mtime)
+    return Path(most_recent.path)
 
 def find_all_json_files(data_dir="data"):
     """Find all JSON files in the data directory, sorted by modification time."""
-    data_path = Path(data_dir)
-    if not data_path.exists():
-        raise FileNotFoundError(f"Data directory '{data_dir}' not found")
-    
-    json_files = list(data_path.glob("*.json"))
-    if not json_files:
-        raise FileNotFoundError("No JSON files found in data directory")
+    json_entries = scan_json_files(data_dir)
     
     # Sort by modification time, oldest first
-    json_files.sort(key=os.path.getmtime)
-    return json_files
+    json_entries.sort(key=lambda entry: entry.stat().st_mtime)
+    return [Path(entry.path) for entry in json_entries]
 
 def post_json_to_slack(json_file_path, bearer_token, url="https://offers-and-asks-slack-nbgim.ondigitalocean.app/external/slack-message"):
     """Post JSON data to the Slack endpoint."""
-    with open(json_file_path, 'r') as f:
-        data = json.load(f)
-    
     headers = {
-        'Authorization': f'Bearer {bearer_token}',
-        'Content-Type': 'application/json'
+        'Authorization': f'Bearer {bearer_token}'
     }
     
-    response = requests.post(url, json=data, headers=headers)
+    # The file is already JSON, so stream its bytes as the request body rather
+    # than parsing it into memory and re-serializing it
+    with open(json_file_path, 'rb') as f:
+        response = session.post(url, data=f, headers=headers)
     
     if response.status_code == 200:
         print(f"Successfully posted {json_file_path.name} to Slack endpoint")
@@ -77,11 +91,10 @@ def main():
             json_files = find_all_json_files()
             print(f"Found {len(json_files)} JSON files to post")
             
-            success_count = 0
-            for json_file in json_files:
-                print(f"\nPosting: {json_file.name}")
-                if post_json_to_slack(json_file, bearer_token):
-                    success_count += 1
+            # Uploads are independent, so send several at once
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                results = executor.map(lambda json_file: post_json_to_slack(json_file, bearer_token), json_files)
+                success_count = sum(1 for success in results if success)
                     
             print(f"\nCompleted: {success_count}/{len(json_files)} files posted successfully")
             return 0 if success_count == len(json_files) else 1
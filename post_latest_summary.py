@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import os
-from datetime import datetime, timedelta
 from src.slack_client import TownCrierSlackClient
 
 def find_latest_summary():
@@ -16,7 +15,7 @@ def find_latest_summary():
         print("❌ No summary files found in summaries directory")
         return None
     
-    latest_file = sorted(summary_files)[-1]
+    latest_file = max(summary_files)
     filepath = os.path.join(summaries_dir, latest_file)
     
     return filepath
@@ -31,10 +30,6 @@ def main():
     
     print(f"📂 Using summary file: {summary_path}")
     
-    # Load the summary content
-    with open(summary_path, 'r', encoding='utf-8') as f:
-        summary_content = f.read()
-    
     # Initialize Slack client
     client = TownCrierSlackClient()
     
@@ -42,64 +37,15 @@ def main():
     print("Testing connection...")
     client.test_connection()
     
-    # Get all channels to find daily-overview
+    # Find #daily-overview, confirm, and post the summary under a date-range message
     print("\nLooking for #daily-overview channel...")
     try:
-        response = client.client.conversations_list(
-            types="public_channel",
-            limit=200
-        )
-        
-        target_channel = None
-        for channel in response['channels']:
-            if channel['name'] == 'daily-overview':
-                target_channel = channel
-                break
-        
-        if not target_channel:
-            print("❌ Could not find #daily-overview channel")
-            print("Available channels:")
-            for channel in response['channels']:
-                print(f"  - #{channel['name']}")
-            return
-        
-        print(f"✅ Found #{target_channel['name']} (ID: {target_channel['id']})")
-        
-    except Exception as e:
-        print(f"❌ Failed to get channels: {str(e)}")
-        return
-    
-    # Show preview
-    print(f"\n📝 Summary preview:")
-    print("-" * 50)
-    print(summary_content[:500] + "..." if len(summary_content) > 500 else summary_content)
-    print("-" * 50)
-    
-    # Confirm posting
-    confirm = input(f"\nPost this summary to #{target_channel['name']}? (y/N): ").strip().lower()
-    if confirm not in ['y', 'yes']:
-        print("Cancelled.")
-        return
-    
-    # Post 7-day date range first
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=7)
-    date_range = f"{start_date.strftime('%B %d')} - {end_date.strftime('%B %d, %Y')}"
-    print(f"\n📤 Posting date message to #{target_channel['name']}...")
-    
-    try:
-        date_response = client.post_message(target_channel['id'], date_range)
-        thread_ts = date_response.get('ts')
-        print(f"✅ Date message posted successfully!")
-        
-        # Post the summary as a reply
-        print(f"📤 Posting summary as reply...")
-        summary_response = client.post_reply(target_channel['id'], thread_ts, summary_content)
-        print(f"✅ Summary posted as reply successfully!")
-        print(f"Thread timestamp: {thread_ts}")
+        thread_ts = client.post_weekly_summary(summary_path, interactive=True)
+        if thread_ts:
+            print(f"Thread timestamp: {thread_ts}")
         
     except Exception as e:
-        print(f"❌ Failed to post messages: {str(e)}")
+        print(f"❌ Failed to post summary: {str(e)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,95 +1,178 @@
 #!/usr/bin/env python3
 
-import json
 import os
 import random
 import time
-from datetime import datetime, timedelta
-from dotenv import load_dotenv
-import anthropic
-from src.slack_client import TownCrierSlackClient
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from src.rate_limiter import RateLimiter
+from src.summarize_utils import (
+    CLAUDE_MAX_TOKENS, TARGET_CHANNEL_PREFIXES, call_claude, claude_limiter, claude_request_params,
+    find_latest_messages_file, format_minute, iter_channels, load_cached_summary, load_prompt,
+    save_cached_summary, timed_entries
+)
 
-def load_prompt():
-    """Load the summarization prompt from file"""
-    try:
-        with open('summarization_prompt.txt', 'r', encoding='utf-8') as f:
-            return f.read().strip()
-    except FileNotFoundError:
-        print("❌ summarization_prompt.txt not found")
-        return None
+# Number of channels summarized concurrently
+SUMMARY_WORKERS = 4
+
+# Claude tokens per minute, kept to about 80% of a Tier 1 account's limit (requests per
+# minute are limited by the shared claude_limiter)
+CLAUDE_TOKENS_PER_MINUTE = 16_000
+
+# Channel context sent to Claude: about 14k tokens, so one channel plus the prompt and
+# reply fits in a minute of the token budget. Older threads beyond this are dropped.
+MAX_CONTEXT_CHARS = 56_000
+
+# Longer messages are cut to this many characters
+MAX_MESSAGE_CHARS = 2_000
+
+# Consecutive messages from one person this close together are merged into one entry
+COLLAPSE_WINDOW_SECONDS = 5 * 60
+
+# Rough characters per token, for estimating request size without a tokenizer
+CHARS_PER_TOKEN = 4
+
+# Shared by all summarization workers
+claude_token_limiter = RateLimiter(CLAUDE_TOKENS_PER_MINUTE)
+
+def clip_text(text):
+    """Cut message text longer than MAX_MESSAGE_CHARS"""
+    return text if len(text) <= MAX_MESSAGE_CHARS else text[:MAX_MESSAGE_CHARS] + "…"
 
 def prepare_channel_context(channel_data):
     """
     Prepare context for a single channel with messages in chronological order
-    and replies attached to their parent messages
+    and replies attached to their parent messages. Returns None if no message
+    has any text, since there is nothing to summarize.
     """
     messages = channel_data.get('messages', [])
     if not messages:
         return "No messages found in this channel."
     
-    # Sort messages chronologically by timestamp
-    sorted_messages = sorted(messages, key=lambda x: float(x.get('timestamp', 0)))
+    if not any((msg.get('text') or '').strip() for msg in messages):
+        return None
     
-    context_parts = []
+    # Messages with text in chronological order, each timestamp parsed only once.
+    # Collection marks channels whose order it has checked, and those aren't re-sorted.
+    presorted = channel_data.get('sorted', False)
+    timed_messages = timed_entries(reversed(messages) if presorted else messages, presorted)
     
-    for msg in sorted_messages:
-        # Skip messages without text
-        if not msg.get('text', '').strip():
-            continue
-            
-        # Format timestamp for readability
-        ts = float(msg.get('timestamp', 0))
-        dt = datetime.fromtimestamp(ts)
-        timestamp_str = dt.strftime('%Y-%m-%d %H:%M')
-        
-        # Main message
-        user_name = msg.get('user_name', 'Unknown')
+    # One list of lines per message thread
+    threads = []
+    # Author and time of the last thread, while it can still absorb follow-up messages
+    last_user = last_ts = None
+    
+    for ts, msg in timed_messages:
         text = msg.get('text', '').strip()
+        user_name = msg.get('user_name', 'Unknown')
+        replies = msg.get('replies', [])
         
-        context_parts.append(f"[{timestamp_str}] {user_name}: {text}")
+        # Fold a quick follow-up from the same person into their previous message
+        if not replies and user_name == last_user and ts - last_ts < COLLAPSE_WINDOW_SECONDS:
+            threads[-1].append(clip_text(text))
+            last_ts = ts
+            continue
+        
+        # Main message, with its timestamp formatted for readability
+        timestamp_str = format_minute(int(ts) // 60)
+        thread_lines = [f"[{timestamp_str}] {user_name}: {clip_text(text)}"]
         
         # Add replies if they exist
-        replies = msg.get('replies', [])
         if replies:
-            # Sort replies chronologically too
-            sorted_replies = sorted(replies, key=lambda x: float(x.get('timestamp', 0)))
-            
-            for reply in sorted_replies:
-                if not reply.get('text', '').strip():
-                    continue
-                    
-                reply_ts = float(reply.get('timestamp', 0))
-                reply_dt = datetime.fromtimestamp(reply_ts)
-                reply_timestamp_str = reply_dt.strftime('%Y-%m-%d %H:%M')
-                reply_user = reply.get('user_name', 'Unknown')
+            # Replies in chronological order too
+            for reply_ts, reply in timed_entries(replies, presorted):
                 reply_text = reply.get('text', '').strip()
+                reply_timestamp_str = format_minute(int(reply_ts) // 60)
+                reply_user = reply.get('user_name', 'Unknown')
                 
-                context_parts.append(f"  └─ [{reply_timestamp_str}] {reply_user}: {reply_text}")
+                thread_lines.append(f"  └─ [{reply_timestamp_str}] {reply_user}: {clip_text(reply_text)}")
         
-        # Add spacing between message threads
-        context_parts.append("")
+        threads.append(thread_lines)
+        last_user, last_ts = (None, None) if replies else (user_name, ts)
     
-    return "\n".join(context_parts)
+    # Keep the most recent threads that fit in MAX_CONTEXT_CHARS
+    kept_threads = []
+    context_length = 0
+    for thread_lines in reversed(threads):
+        thread_text = "\n".join(thread_lines)
+        context_length += len(thread_text) + 2
+        if context_length > MAX_CONTEXT_CHARS and kept_threads:
+            kept_threads.append("[earlier messages omitted]")
+            break
+        kept_threads.append(thread_text)
+    
+    # Separate message threads with a blank line
+    return "\n\n".join(reversed(kept_threads))
 
 def summarize_channel_with_claude(prompt, context, client):
     """Send the prompt and context to Claude for summarization"""
-    try:
-        full_prompt = f"{prompt}\n\n---\n\nChannel messages:\n\n{context}"
+    channel_messages = f"Channel messages:\n\n{context}"
+    
+    # A request larger than the whole per-minute token budget could never be sent, so
+    # keep only as many of the most recent lines as fit
+    max_chars = (CLAUDE_TOKENS_PER_MINUTE - CLAUDE_MAX_TOKENS) * CHARS_PER_TOKEN - len(prompt)
+    if len(channel_messages) > max_chars:
+        omitted_note = "[earlier messages omitted]\n"
+        kept_context = context[len(channel_messages) - max_chars + len(omitted_note):]
+        kept_context = kept_context[kept_context.find("\n") + 1:]
+        context = f"{omitted_note}{kept_context}"
+        channel_messages = f"Channel messages:\n\n{context}"
+    estimated_tokens = (len(prompt) + len(channel_messages)) // CHARS_PER_TOKEN + CLAUDE_MAX_TOKENS
+    
+    # Reuse the summary from an earlier run if this exact request was already made
+    summary = load_cached_summary(prompt, context)
+    if summary is not None:
+        return summary
+    
+    def request(client):
+        claude_limiter.acquire()
+        # The longest possible summary is counted against the token budget up front
+        claude_token_limiter.acquire(min(estimated_tokens, CLAUDE_TOKENS_PER_MINUTE))
+        response = client.messages.create(**claude_request_params(prompt, context))
+        return response.content[0].text
+    
+    summary = call_claude(client, request)
+    if summary:
+        save_cached_summary(prompt, context, summary)
+    
+    return summary
+
+def resume_summary(messages_file):
+    """
+    Find the unfinished summary of `messages_file` left by an interrupted step 2.
+    Returns (partial summary path, progress path, channels already summarized);
+    new paths and an empty set if there is nothing to resume.
+    """
+    summaries_dir = "summaries"
+    os.makedirs(summaries_dir, exist_ok=True)
+    
+    for name in os.listdir(summaries_dir):
+        if not name.endswith(".txt.partial"):
+            continue
+        partial_path = os.path.join(summaries_dir, name)
+        progress_path = partial_path[:-len(".partial")] + ".progress"
         
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1000,
-            messages=[{
-                "role": "user",
-                "content": full_prompt
-            }]
-        )
+        # Only step 2 writes a progress sidecar; any other .partial isn't ours to touch
+        if not os.path.exists(progress_path):
+            continue
         
-        return response.content[0].text
+        # The first progress line names the messages file the summaries came from
+        try:
+            with open(progress_path, 'r', encoding='utf-8') as f:
+                source_file, *done_channels = f.read().splitlines()
+        except ValueError:
+            source_file, done_channels = None, []
         
-    except Exception as e:
-        print(f"❌ Error calling Claude API: {str(e)}")
-        return None
+        if source_file == messages_file:
+            return partial_path, progress_path, set(done_channels)
+        
+        # Left over from an older collection; start over rather than mix weeks
+        os.remove(partial_path)
+        os.remove(progress_path)
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    partial_path = os.path.join(summaries_dir, f"summary_{timestamp}.txt.partial")
+    return partial_path, partial_path[:-len(".partial")] + ".progress", set()
 
 def step1_collect_messages():
     """Step 1: Collect messages from Slack"""
@@ -114,21 +197,16 @@ def step2_generate_summaries():
     step_start = time.time()
     
     try:
-        # Find the most recent JSON file
-        data_dir = "data"
-        json_files = [f for f in os.listdir(data_dir) if f.startswith("messages_") and f.endswith(".json")]
-        if not json_files:
-            print("❌ No message files found")
+        filepath = find_latest_messages_file()
+        if not filepath:
             return False, 0
+        latest_file = os.path.basename(filepath)
         
-        latest_file = sorted(json_files)[-1]
-        filepath = os.path.join(data_dir, latest_file)
+        # Set up Claude client. anthropic (and the httpx/pydantic stack behind it) is
+        # imported here so the other steps don't pay for loading it
+        import anthropic
+        from dotenv import load_dotenv
         
-        # Load the JSON data
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Set up Claude client
         load_dotenv()
         api_key = os.getenv('ANTHROPIC_API_KEY')
         
@@ -143,68 +221,90 @@ def step2_generate_summaries():
         if not prompt:
             return False, 0
         
-        # Find all lab-notes and surface-area channels
-        channels = data.get('channels', {})
-        target_channels = []
-        
-        for channel_name in channels.keys():
-            if channel_name.startswith('lab-notes-') or channel_name.startswith('surface-area-'):
-                channel_data = channels[channel_name]
-                # Skip channels with errors or no messages
-                if not channel_data.get('error') and channel_data.get('message_count', 0) > 0:
-                    target_channels.append(channel_name)
-        
-        if not target_channels:
+        # Summaries are appended to a .partial file as each one is ready, with finished
+        # channel names in a .progress sidecar, so a crashed run resumes where it stopped
+        partial_path, progress_path, done_channels = resume_summary(latest_file)
+        if done_channels:
+            print(f"♻️  Resuming {partial_path}: {len(done_channels)} channels already summarized")
+        
+        # Find all lab-notes and surface-area channels, keeping only the prepared context
+        # (not the raw channel data) for each one still to be summarized
+        n_targets = 0
+        pending_channels = []
+        for channel_name, channel_data in iter_channels(filepath, keep=lambda name: name.startswith(TARGET_CHANNEL_PREFIXES)):
+            # Skip channels with errors or no messages
+            if not channel_data.get('error') and channel_data.get('message_count', 0) > 0:
+                n_targets += 1
+                if channel_name not in done_channels:
+                    pending_channels.append((channel_name, channel_data.get('id'), prepare_channel_context(channel_data)))
+        
+        if not n_targets:
             print("❌ No accessible channels found with messages")
             return False, 0
         
         # Randomize the order
-        random.shuffle(target_channels)
-        print(f"📊 Found {len(target_channels)} channels to summarize")
-        
-        # Generate summaries for all channels
-        all_summaries = []
-        
-        for i, channel_name in enumerate(target_channels, 1):
-            print(f"🤖 [{i}/{len(target_channels)}] Summarizing #{channel_name}...")
-            
-            channel_data = channels[channel_name]
-            context = prepare_channel_context(channel_data)
-            summary = summarize_channel_with_claude(prompt, context, anthropic_client)
-            
-            if summary:
-                # Clean up unnecessary newlines in the summary
-                cleaned_summary = "\n".join(line for line in summary.split('\n') if line.strip())
-                
-                # Format channel name as clickable link
-                channel_id = channel_data.get('id')
-                channel_link = f"<#{channel_id}|{channel_name}>" if channel_id else f"#{channel_name}"
-                
-                # Format the summary with channel header
-                channel_summary = f"{channel_link}\n{cleaned_summary}"
-                all_summaries.append(channel_summary)
-                print(f"✅ Summary complete for #{channel_name}")
-            else:
-                print(f"❌ Failed to summarize #{channel_name}")
-        
-        # Create final output and save
-        if all_summaries:
-            final_output = "\n\n".join(all_summaries)
-            
-            # Save to file
-            os.makedirs("summaries", exist_ok=True)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"summaries/summary_{timestamp}.txt"
+        random.shuffle(pending_channels)
+        print(f"📊 Found {n_targets} channels to summarize")
+        
+        # Claude calls are independent and network-bound, so run several at once
+        print(f"🤖 Summarizing {len(pending_channels)} channels from {latest_file} ({SUMMARY_WORKERS} at a time)...")
+        needs_separator = os.path.exists(partial_path) and os.path.getsize(partial_path) > 0
+        with ThreadPoolExecutor(max_workers=SUMMARY_WORKERS) as executor, \
+                open(partial_path, 'a', encoding='utf-8') as summary_file, \
+                open(progress_path, 'a', encoding='utf-8') as progress_file:
+            # The header goes in once per progress file; a resume that hasn't finished any
+            # channel yet must not add it again, or it would be read back as a channel name
+            if progress_file.tell() == 0:
+                progress_file.write(latest_file + "\n")
             
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(final_output)
+            # Channels with no text to summarize get a one-line note instead of a Claude call
+            futures = [
+                (channel_name, channel_id, executor.submit(summarize_channel_with_claude, prompt, context, anthropic_client) if context is not None else None)
+                for channel_name, channel_id, context in pending_channels
+            ]
             
-            step_time = time.time() - step_start
-            print(f"✅ Step 2 completed in {step_time/60:.1f} minutes - saved to {filename}")
-            return True, step_time
-        else:
+            try:
+                # Write in the shuffled order, each summary as soon as it is ready
+                for i, (channel_name, channel_id, future) in enumerate(futures, 1):
+                    summary = future.result() if future else "Quiet this week: no text messages"
+                    status = "✅" if summary else "❌"
+                    print(f"{status} [{i}/{len(futures)}] #{channel_name}")
+                    
+                    if summary:
+                        # Clean up unnecessary newlines in the summary
+                        cleaned_summary = "\n".join(line for line in summary.split('\n') if line.strip())
+                        
+                        # Format channel name as clickable link
+                        channel_link = f"<#{channel_id}|{channel_name}>" if channel_id else f"#{channel_name}"
+                        
+                        # Format the summary with channel header
+                        if needs_separator:
+                            summary_file.write("\n\n")
+                        summary_file.write(f"{channel_link}\n{cleaned_summary}")
+                        summary_file.flush()
+                        needs_separator = True
+                        
+                        progress_file.write(channel_name + "\n")
+                        progress_file.flush()
+            except BaseException:
+                # On Ctrl-C (or an error) drop the channels not yet started instead of letting
+                # the pool's exit summarize every one of them only for the results to be discarded
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+        
+        # Finished: give the summary its final name so later steps can pick it up
+        os.remove(progress_path)
+        if not needs_separator:
+            os.remove(partial_path)
             print("❌ No summaries were generated")
             return False, time.time() - step_start
+        
+        filename = partial_path[:-len(".partial")]
+        os.replace(partial_path, filename)
+        
+        step_time = time.time() - step_start
+        print(f"✅ Step 2 completed in {step_time/60:.1f} minutes - saved to {filename}")
+        return True, step_time
             
     except Exception as e:
         print(f"❌ Step 2 failed: {str(e)}")
@@ -223,50 +323,19 @@ def step3_post_to_slack():
             print("❌ No summary files found")
             return False, 0
         
-        latest_file = sorted(summary_files)[-1]
+        latest_file = max(summary_files)
         filepath = os.path.join(summaries_dir, latest_file)
         
-        # Load the summary content
-        with open(filepath, 'r', encoding='utf-8') as f:
-            summary_content = f.read()
-        
         # Initialize Slack client
+        from src.slack_client import TownCrierSlackClient
         client = TownCrierSlackClient()
         
         # Test connection
         client.test_connection()
         
-        # Get all channels to find daily-overview
-        response = client.client.conversations_list(
-            types="public_channel",
-            limit=200
-        )
-        
-        target_channel = None
-        for channel in response['channels']:
-            if channel['name'] == 'daily-overview':
-                target_channel = channel
-                break
-        
-        if not target_channel:
-            print("❌ Could not find #daily-overview channel")
+        # Post to #daily-overview as a date-range message with the summary as its reply
+        if not client.post_weekly_summary(filepath):
             return False, 0
-        
-        print(f"✅ Found #{target_channel['name']} (ID: {target_channel['id']})")
-        
-        # Post 7-day date range first
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=7)
-        date_range = f"{start_date.strftime('%B %d')} - {end_date.strftime('%B %d, %Y')}"
-        print(f"📤 Posting date message to #{target_channel['name']}...")
-        
-        date_response = client.post_message(target_channel['id'], date_range)
-        thread_ts = date_response.get('ts')
-        print(f"✅ Date message posted successfully!")
-        
-        # Post the summary as a reply
-        print(f"📤 Posting summary as reply...")
-        summary_response = client.post_reply(target_channel['id'], thread_ts, summary_content)
         print(f"✅ Summary posted as reply successfully!")
         
         step_time = time.time() - step_start
@@ -285,6 +354,7 @@ def step4_post_to_external_endpoint():
     try:
         # Import the post_latest_data functionality
         from post_latest_data import find_most_recent_json, post_json_to_slack
+        from dotenv import load_dotenv
         
         # Load environment variables from .env file
         load_dotenv()
@@ -333,14 +403,18 @@ def main():
         print("\n❌ Pipeline failed at Step 2")
         return
     
-    # Step 3: Post to Slack
-    success3, time3 = step3_post_to_slack()
+    # Step 3: Post to Slack, and Step 4: Post to external endpoint. Neither depends on
+    # the other, so step 4 runs while step 3 waits on Slack's rate limits
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        step3 = executor.submit(step3_post_to_slack)
+        step4 = executor.submit(step4_post_to_external_endpoint)
+        success3, time3 = step3.result()
+        success4, time4 = step4.result()
+    
     if not success3:
         print("\n❌ Pipeline failed at Step 3")
         return
     
-    # Step 4: Post to external endpoint
-    success4, time4 = step4_post_to_external_endpoint()
     if not success4:
         print("\n⚠️  Step 4 failed, but continuing...")
     
@@ -0,0 +1,189 @@
+import logging
+import re
+
+log = logging.getLogger(__name__)
+
+# Every possible 20-cell progress bar, indexed by the number of filled cells
+PROGRESS_BARS = ["█" * filled + "░" * (20 - filled) for filled in range(21)]
+
+# User mentions in the format <@USER_ID>
+MENTION_PATTERN = re.compile(r'<@(U[A-Z0-9]+)>')
+
+def lookup_user(client, user_cache, user_id):
+    """
+    The cached record for `user_id`, or None if there is no user. Users missing from
+    the prefetched list (e.g. people who joined since it was fetched) are looked up
+    with users.info and added to `user_cache`.
+    """
+    if not user_id:
+        return None
+    user_info = user_cache.get(user_id)
+    if user_info is None:
+        user_info = user_cache[user_id] = client.get_user_info(user_id)
+    return user_info
+
+def resolve_user_mentions(client, text, user_cache):
+    """Replace <@USER_ID> mentions with user names"""
+    # Most messages mention nobody; skip the regex entirely for those
+    if not text or '<@' not in text:
+        return text
+    
+    def replace_mention(match):
+        user_info = lookup_user(client, user_cache, match.group(1))
+        if user_info and user_info['resolved_name'] != 'Unknown':
+            return f"@{user_info['resolved_name']}"
+        return match.group(0)
+    
+    # Resolve every mention in a single pass over the text
+    return MENTION_PATTERN.sub(replace_mention, text)
+
+def process_reply(client, reply, user_cache):
+    """Build the stored form of a single thread reply"""
+    reply_user_id = reply.get('user')
+    
+    # Resolve reply user ID to name
+    reply_user = lookup_user(client, user_cache, reply_user_id)
+    reply_user_name = reply_user['resolved_name'] if reply_user else "Unknown"
+    
+    # Replace user mentions in reply text
+    resolved_reply_text = resolve_user_mentions(client, reply.get('text', ''), user_cache)
+    
+    if log.isEnabledFor(logging.DEBUG):
+        reply_head = resolved_reply_text[:100] + "..." if len(resolved_reply_text) > 100 else resolved_reply_text
+        log.debug("      🧵 Reply head: %r", reply_head)
+    
+    return {
+        "timestamp": reply.get('ts'),
+        "user_id": reply_user_id,
+        "user_name": reply_user_name,
+        "text": resolved_reply_text,
+        "type": reply.get('type'),
+        "subtype": reply.get('subtype'),
+        "thread_ts": reply.get('thread_ts')
+    }
+
+def process_message(client, msg, user_cache, thread_replies_by_ts):
+    """Build the stored form of a single message, with its already-fetched thread replies attached"""
+    # Read each field once up front
+    ts = msg.get('ts')
+    user_id = msg.get('user')
+    msg_text = msg.get('text', '')
+    thread_ts = msg.get('thread_ts')
+    reply_count = msg.get('reply_count', 0)
+    
+    # Resolve user ID to name
+    user = lookup_user(client, user_cache, user_id)
+    user_name = user['resolved_name'] if user else "Unknown"
+    
+    # Replace user mentions in message text
+    resolved_text = resolve_user_mentions(client, msg_text, user_cache)
+    
+    if log.isEnabledFor(logging.DEBUG):
+        msg_head = resolved_text[:100] + "..." if len(resolved_text) > 100 else resolved_text
+        log.debug("    📄 Message head: %r", msg_head)
+        log.debug("    reply_count=%s, thread_ts=%s", reply_count, thread_ts)
+    
+    # Attach replies for any message that has replies (it's a thread parent)
+    replies = []
+    if reply_count > 0:
+        thread_replies = thread_replies_by_ts[ts]
+        log.debug("    Got %d of %d replies for parent message: %s...", len(thread_replies), reply_count, msg_text[:50])
+        replies = [process_reply(client, reply, user_cache) for reply in thread_replies]
+    
+    return {
+        "timestamp": ts,
+        "user_id": user_id,
+        "user_name": user_name,
+        "text": resolved_text,
+        "type": msg.get('type'),
+        "subtype": msg.get('subtype'),
+        "thread_ts": thread_ts,
+        "reply_count": reply_count,
+        "replies": replies
+    }
+
+def process_messages(client, channel_id, messages, user_cache):
+    """
+    Resolve user names and mentions for a page of raw Slack messages and attach
+    threaded replies. Returns (processed_messages, thread_replies_count).
+    """
+    # Replies can already be in the history page (e.g. broadcast to the channel);
+    # group them by thread so complete threads don't need another API call
+    thread_replies_by_ts = {}
+    for msg in messages:
+        thread_ts = msg.get('thread_ts')
+        if thread_ts and msg.get('ts') != thread_ts:
+            thread_replies_by_ts.setdefault(thread_ts, []).append(msg)
+    for replies in thread_replies_by_ts.values():
+        replies.sort(key=lambda reply: float(reply.get('ts', 0)))
+    
+    # Fetch every incomplete thread in the channel concurrently up front
+    thread_parents = [
+        msg.get('ts') for msg in messages
+        if msg.get('reply_count', 0) > len(thread_replies_by_ts.get(msg.get('ts'), []))
+    ]
+    thread_replies_by_ts.update(zip(thread_parents, client.get_thread_replies_many(channel_id, thread_parents)))
+    
+    # Besides users.info for the occasional user missing from the prefetched list, all
+    # I/O is done above, so building the output is a plain comprehension
+    processed_messages = [process_message(client, msg, user_cache, thread_replies_by_ts) for msg in messages]
+    thread_replies_count = sum(len(msg['replies']) for msg in processed_messages)
+    
+    return processed_messages, thread_replies_count
+
+def referenced_user_ids(channel_data):
+    """
+    IDs of the users a collected channel still refers to by ID: the authors of its
+    messages and replies, and any mention that couldn't be resolved to a name
+    """
+    user_ids = set()
+    for msg in channel_data.get('messages', []):
+        for entry in (msg, *msg.get('replies', [])):
+            if entry.get('user_id'):
+                user_ids.add(entry['user_id'])
+            text = entry.get('text') or ''
+            if '<@' in text:
+                user_ids.update(MENTION_PATTERN.findall(text))
+    return user_ids
+
+def timestamps_ascending(entries):
+    """Whether processed messages or replies are in chronological order"""
+    timestamps = [float(entry.get('timestamp') or 0) for entry in entries]
+    return all(earlier <= later for earlier, later in zip(timestamps, timestamps[1:]))
+
+def collect_channel(client, channel, user_cache, fetch_history):
+    """
+    Fetch a channel's messages with `fetch_history(channel_id)` and process them.
+    Failures are recorded in the returned channel entry rather than raised.
+    """
+    channel_id = channel['id']
+    
+    try:
+        messages = fetch_history(channel_id)
+        processed_messages, thread_replies_count = process_messages(client, channel_id, messages, user_cache)
+        
+        # Slack returns history newest first and thread replies oldest first. Checking
+        # that here lets summarizing trust the order instead of sorting again.
+        in_order = (timestamps_ascending(processed_messages[::-1])
+                    and all(timestamps_ascending(msg['replies']) for msg in processed_messages))
+        
+        return {
+            "id": channel_id,
+            "message_count": len(messages),
+            "thread_replies_count": thread_replies_count,
+            # True when messages are newest first and each message's replies oldest first
+            "sorted": in_order,
+            "messages": processed_messages
+        }
+    
+    except Exception as e:
+        if "not_in_channel" in str(e):
+            error = "bot_not_in_channel"
+        else:
+            error = str(e)
+        return {
+            "id": channel_id,
+            "error": error,
+            "message_count": 0,
+            "messages": []
+        }
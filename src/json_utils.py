@@ -0,0 +1,37 @@
+import json
+import mmap
+import os
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the standard library
+    orjson = None
+
+def dumps(obj, indent=False):
+    """Serialize obj to UTF-8 encoded JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def loads(data):
+    """Parse JSON from bytes or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def load_file(path):
+    """Read and parse a JSON file"""
+    with open(path, 'rb') as f:
+        # orjson can parse straight from a memory map, so large files are paged in by
+        # the kernel instead of first being copied into a bytes object
+        if orjson is not None and os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return orjson.loads(memoryview(mapped))
+        return loads(f.read())
+
+def dump_file(obj, path, indent=False):
+    """Serialize obj and write it to path"""
+    with open(path, 'wb') as f:
+        f.write(dumps(obj, indent=indent))
@@ -0,0 +1,44 @@
+import threading
+import time
+
+class RateLimiter:
+    """
+    Thread-safe token bucket. Calls only wait when the bucket is empty, so
+    bursts go straight through while the long-run rate stays under the limit.
+    """
+    
+    def __init__(self, rate_per_minute, capacity=None):
+        self.capacity = capacity or rate_per_minute
+        self.refill_rate = rate_per_minute / 60.0  # Tokens per second
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+    
+    def _refill(self, now):
+        elapsed = now - self.last_refill
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+        self.last_refill = now
+    
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available, then take them"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= tokens:
+                        self.tokens -= tokens
+                        return
+                    wait = (tokens - self.tokens) / self.refill_rate
+            time.sleep(wait)
+    
+    def pause(self, seconds):
+        """Empty the bucket and hold every caller for `seconds` (e.g. a Retry-After)"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = 0
+            self.last_refill = max(self.last_refill, now + seconds)
+            self.paused_until = max(self.paused_until, now + seconds)
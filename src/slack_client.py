@@ -1,9 +1,74 @@
+import logging
 import os
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
+from src import json_utils
+from src.rate_limiter import RateLimiter
+
+log = logging.getLogger(__name__)
+
+# Requests per minute allowed for each Slack API method we call, per Slack's rate limit tiers
+RATE_LIMITS = {
+    'auth.test': 100,              # Special
+    'conversations.list': 20,      # Tier 2
+    'conversations.history': 50,   # Tier 3
+    'conversations.replies': 50,   # Tier 3
+    'users.list': 20,              # Tier 2
+    'users.info': 100,             # Tier 4
+    'chat.postMessage': 60,        # Special: about one message per second per channel
+    'files.upload': 20,            # files_upload_v2 chains several Tier 2-4 calls
+}
+
+# Number of thread-reply fetches in flight per get_thread_replies_many call
+REPLY_WORKERS = 4
+
+# Seconds to wait before each retry of a call that failed for reasons other than rate
+# limiting; each delay is jittered so concurrent callers don't retry in lockstep
+RETRY_DELAYS = [5, 15, 60]
+
+# Users change names rarely, so the user list is kept on disk and reused for a day
+USER_CACHE_PATH = os.path.join("cache", "users.json")
+USER_CACHE_TTL = 24 * 60 * 60
+
+# Messages per conversations.history page; the maximum Slack allows, so busy channels
+# need as few rate-limited calls as possible
+HISTORY_PAGE_SIZE = 999
+
+# Message fields the collectors use; everything else Slack returns (blocks, attachments,
+# reactions, ...) is dropped as soon as a page arrives
+MESSAGE_KEYS = ('ts', 'user', 'text', 'type', 'subtype', 'thread_ts', 'reply_count')
+
+def slim_message(msg):
+    """Keep only the MESSAGE_KEYS fields of a Slack message"""
+    return {key: msg[key] for key in MESSAGE_KEYS if key in msg}
+
+def get_retry_after(error, default=60):
+    """Seconds Slack asked us to wait (Retry-After header) before retrying a rate-limited call"""
+    headers = getattr(error.response, 'headers', None) or {}
+    for name, value in headers.items():
+        if name.lower() == 'retry-after':
+            return int(value)
+    return default
+
+def user_record(user_id, user):
+    """Reduce a Slack user object to the fields we cache"""
+    name = user.get('name', 'Unknown')
+    real_name = user.get('real_name', 'Unknown')
+    display_name = user.get('profile', {}).get('display_name', '')
+    return {
+        'id': user_id,
+        'name': name,
+        'real_name': real_name,
+        'display_name': display_name,
+        # Name to show for this user, resolved once here rather than per message
+        'resolved_name': display_name or real_name or name or 'Unknown',
+    }
 
 class TownCrierSlackClient:
     def __init__(self):
@@ -14,12 +79,51 @@ class TownCrierSlackClient:
             raise ValueError("SLACK_BOT_TOKEN not found in environment variables")
         
         self.client = WebClient(token=self.token)
+        self.rate_limiters = {method: RateLimiter(limit) for method, limit in RATE_LIMITS.items()}
+        self.channels_by_name = None
+        self.user_cache_lock = threading.Lock()
+        self.users_listed_at, self.user_cache = self.load_user_cache()
         print(f"Initialized Slack client with token: {self.token[:12]}...")
     
+    def wait_for_rate_limit(self, method):
+        """Block until the rate limiter for this Slack API method allows another call"""
+        self.rate_limiters[method].acquire()
+    
+    def back_off(self, method, error, default=60):
+        """Hold all callers of this method for the Retry-After period and return it"""
+        retry_after = get_retry_after(error, default)
+        self.rate_limiters[method].pause(retry_after)
+        return retry_after
+    
+    def call_api(self, method, max_retries=3, retry_errors=False, **params):
+        """
+        Call a Slack Web API method (e.g. 'conversations.history') through its rate
+        limiter, retrying after Slack's Retry-After when rate limited. With
+        retry_errors=True other API errors are retried too, after RETRY_DELAYS.
+        The last SlackApiError is raised once retries run out.
+        """
+        api_method = getattr(self.client, method.replace('.', '_'))
+        
+        for attempt in range(max_retries):
+            try:
+                self.wait_for_rate_limit(method)
+                return api_method(**params)
+            except SlackApiError as e:
+                error_code = e.response['error']
+                if attempt == max_retries - 1 or not (error_code == 'rate_limited' or retry_errors):
+                    raise
+                
+                if error_code == 'rate_limited':
+                    retry_after = self.back_off(method, e)
+                    print(f"  Rate limited on {method}, retrying in {retry_after} seconds (attempt {attempt + 1}/{max_retries})...")
+                else:
+                    retry_delay = RETRY_DELAYS[min(attempt, len(RETRY_DELAYS) - 1)] * random.uniform(0.5, 1.5)
+                    print(f"  {method} failed ({error_code}), retrying in {retry_delay:.0f} seconds (attempt {attempt + 1}/{max_retries})...")
+                    time.sleep(retry_delay)
+    
     def test_connection(self):
         try:
-            time.sleep(30)  # Rate limiting before API call
-            response = self.client.auth_test()
+            response = self.call_api('auth.test')
             print(f"✅ Connected to Slack successfully!")
             print(f"   Bot name: {response['user']}")
             print(f"   Team: {response['team']}")
@@ -29,17 +133,41 @@ class TownCrierSlackClient:
             print(f"❌ Failed to connect to Slack: {e.response['error']}")
             raise
     
+    def list_public_channels(self, max_retries=3):
+        """List every public channel in the workspace; fetched once per client, then reused"""
+        if self.channels_by_name is not None:
+            return list(self.channels_by_name.values())
+        
+        # Follow the cursor so workspaces with more channels than one page are fully listed
+        all_channels = []
+        cursor = None
+        
+        while True:
+            params = {'types': "public_channel", 'limit': 1000}
+            if cursor:
+                params['cursor'] = cursor
+            
+            response = self.call_api('conversations.list', max_retries, **params)
+            all_channels.extend(response['channels'])
+            
+            cursor = response.get('response_metadata', {}).get('next_cursor')
+            if not cursor:
+                break
+        
+        # Index by name so lookups don't rescan the listing
+        self.channels_by_name = {channel['name']: channel for channel in all_channels}
+        return all_channels
+    
+    def get_channel_by_name(self, name):
+        """Find a public channel by name in the cached channel listing, or None"""
+        self.list_public_channels()
+        return self.channels_by_name.get(name)
+    
     def get_all_accessible_channels(self):
         try:
             # Get all public channels the bot has access to
             print("Getting all accessible public channels...")
-            time.sleep(30)  # Rate limiting before API call
-            response = self.client.conversations_list(
-                types="public_channel",
-                limit=200
-            )
-            
-            all_channels = response['channels']
+            all_channels = self.list_public_channels()
             print(f"Found {len(all_channels)} total public channels")
             
             # Filter for channels the bot is actually a member of
@@ -86,7 +214,9 @@ class TownCrierSlackClient:
             oldest_time = datetime.now() - timedelta(days=days)
             oldest_timestamp = oldest_time.timestamp()
             
-            print(f"Fetching messages from last {days} days (since {oldest_time.strftime('%Y-%m-%d %H:%M:%S')})...")
+            # Channels are fetched concurrently, so per-page progress goes to the debug log
+            # rather than interleaving on stdout
+            log.debug("Fetching messages from last %d days (since %s)...", days, oldest_time.strftime('%Y-%m-%d %H:%M:%S'))
             
             all_messages = []
             cursor = None
@@ -94,56 +224,27 @@ class TownCrierSlackClient:
             
             while True:
                 page_count += 1
-                time.sleep(30)  # Rate limiting before API call
                 
                 # Build API call parameters
-                # Note: Slack's conversations.history API now has a limit of 15 messages per request
-                # (reduced from previous limit of 100). We use pagination to get all messages
-                # within our 7-day window by making multiple requests with cursor.
+                # Slack filters to our window server-side via `oldest`; we still paginate
+                # with the cursor in case the window holds more than one page.
                 params = {
                     'channel': channel_id,
-                    'limit': 15  # Current Slack API limit per request
+                    'oldest': str(oldest_timestamp),
+                    'limit': HISTORY_PAGE_SIZE
                 }
                 
                 if cursor:
                     params['cursor'] = cursor
                 
-                print(f"  Page {page_count}: requesting up to {params['limit']} messages...")
-                
-                # Retry logic for rate limits
-                max_retries = 3
-                for retry in range(max_retries):
-                    try:
-                        response = self.client.conversations_history(**params)
-                        break  # Success, exit retry loop
-                    except SlackApiError as e:
-                        if e.response['error'] == 'rate_limited':
-                            retry_after = int(e.response.get('headers', {}).get('Retry-After', 120))
-                            print(f"  Rate limited, retrying in {retry_after} seconds (attempt {retry + 1}/{max_retries})...")
-                            time.sleep(retry_after)
-                        else:
-                            raise  # Re-raise non-rate-limit errors
-                else:
-                    # All retries exhausted
-                    raise SlackApiError("Rate limit retries exhausted", response={'error': 'rate_limited'})
-                
-                page_messages = response['messages']
+                log.debug("  Page %d: requesting up to %d messages...", page_count, params['limit'])
                 
-                # Filter messages to only include those within our 7-day window
-                messages_in_window = []
-                for msg in page_messages:
-                    msg_timestamp = float(msg.get('ts', 0))
-                    if msg_timestamp >= oldest_timestamp:
-                        messages_in_window.append(msg)
-                    else:
-                        # We've reached messages older than our window, stop here
-                        print(f"  Reached messages older than {days} days, stopping pagination")
-                        all_messages.extend(messages_in_window)
-                        print(f"Found {len(all_messages)} messages total in channel from last {days} days")
-                        return all_messages
+                response = self.call_api('conversations.history', **params)
                 
-                all_messages.extend(messages_in_window)
-                print(f"  Page {page_count}: got {len(messages_in_window)} messages in window (total: {len(all_messages)})")
+                # `oldest` means every returned message is already inside our window
+                page_messages = [slim_message(msg) for msg in response['messages']]
+                all_messages.extend(page_messages)
+                log.debug("  Page %d: got %d messages in window (total: %d)", page_count, len(page_messages), len(all_messages))
                 
                 # Check if we have more pages
                 if not response.get('has_more', False):
@@ -153,7 +254,7 @@ class TownCrierSlackClient:
                 if not cursor:
                     break
             
-            print(f"Found {len(all_messages)} messages total in channel from last {days} days")
+            log.debug("Found %d messages total in channel from last %d days", len(all_messages), days)
             
             return all_messages
             
@@ -161,78 +262,104 @@ class TownCrierSlackClient:
             print(f"❌ Failed to get channel history: {e.response['error']}")
             raise
     
-    def get_thread_replies(self, channel_id, thread_ts):
+    def get_thread_replies(self, channel_id, thread_ts, max_retries=3):
         try:
-            time.sleep(30)  # Rate limiting before API call
-            response = self.client.conversations_replies(
-                channel=channel_id,
-                ts=thread_ts
-            )
+            response = self.call_api('conversations.replies', max_retries, channel=channel_id, ts=thread_ts)
             
             replies = response['messages']
             # First message is the original, rest are replies
-            return replies[1:] if len(replies) > 1 else []
+            return [slim_message(reply) for reply in replies[1:]]
             
         except SlackApiError as e:
             print(f"❌ Failed to get thread replies: {e.response['error']}")
             return []
     
+    def get_thread_replies_many(self, channel_id, thread_ts_list):
+        """
+        Fetch the replies of several threads in a channel concurrently; the rate
+        limiter still paces the underlying conversations.replies calls. Returns one
+        list of replies per thread, in the order given.
+        """
+        if not thread_ts_list:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=REPLY_WORKERS) as executor:
+            return list(executor.map(lambda thread_ts: self.get_thread_replies(channel_id, thread_ts), thread_ts_list))
+    
     def post_message(self, channel_id, text, max_retries=3):
-        for attempt in range(max_retries):
-            try:
-                time.sleep(30)  # Rate limiting before API call
-                response = self.client.chat_postMessage(
-                    channel=channel_id,
-                    text=text
-                )
-                print(f"✅ Message posted successfully!")
-                return response
-                
-            except SlackApiError as e:
-                error_code = e.response['error']
-                print(f"❌ Failed to post message (attempt {attempt + 1}/{max_retries}): {error_code}")
-                
-                if error_code == 'rate_limited':
-                    retry_after = int(e.response.get('headers', {}).get('Retry-After', 60))
-                    print(f"   Rate limited, retrying in {retry_after} seconds...")
-                    time.sleep(retry_after)
-                elif attempt < max_retries - 1:  # Not the last attempt
-                    print(f"   Retrying in 10 seconds...")
-                    time.sleep(10)
-                else:
-                    print(f"   All {max_retries} attempts failed")
-                    raise
+        try:
+            response = self.call_api('chat.postMessage', max_retries, retry_errors=True,
+                                     channel=channel_id, text=text)
+            print(f"✅ Message posted successfully!")
+            return response
+            
+        except SlackApiError as e:
+            print(f"❌ Failed to post message after {max_retries} attempts: {e.response['error']}")
+            raise
     
     def post_reply(self, channel_id, thread_ts, text, max_retries=3):
-        for attempt in range(max_retries):
-            try:
-                time.sleep(5)  # Reduced delay for replies
-                response = self.client.chat_postMessage(
-                    channel=channel_id,
-                    thread_ts=thread_ts,
-                    text=text
-                )
-                print(f"✅ Reply posted successfully!")
-                return response
-                
-            except SlackApiError as e:
-                error_code = e.response['error']
-                print(f"❌ Failed to post reply (attempt {attempt + 1}/{max_retries}): {error_code}")
-                
-                if error_code == 'rate_limited':
-                    retry_after = int(e.response.get('headers', {}).get('Retry-After', 60))
-                    print(f"   Rate limited, retrying in {retry_after} seconds...")
-                    time.sleep(retry_after)
-                elif attempt < max_retries - 1:  # Not the last attempt
-                    print(f"   Retrying in 10 seconds...")
-                    time.sleep(10)
-                else:
-                    print(f"   All {max_retries} attempts failed")
-                    raise
+        try:
+            response = self.call_api('chat.postMessage', max_retries, retry_errors=True,
+                                     channel=channel_id, thread_ts=thread_ts, text=text)
+            print(f"✅ Reply posted successfully!")
+            return response
+            
+        except SlackApiError as e:
+            print(f"❌ Failed to post reply after {max_retries} attempts: {e.response['error']}")
+            raise
+    
+    def post_weekly_summary(self, summary_path, channel_name='daily-overview', interactive=False):
+        """
+        Post a summary file to a channel as a thread: the last 7 days' date range as the
+        message and the summary as its reply. With interactive=True a preview is shown
+        and the user must confirm first. Returns the thread timestamp, or None if
+        nothing was posted.
+        """
+        with open(summary_path, 'r', encoding='utf-8') as f:
+            summary_content = f.read()
+        
+        target_channel = self.get_channel_by_name(channel_name)
+        if not target_channel:
+            print(f"❌ Could not find #{channel_name} channel")
+            if interactive:
+                print("Available channels:")
+                for channel in self.list_public_channels():
+                    print(f"  - #{channel['name']}")
+            return None
+        
+        print(f"✅ Found #{target_channel['name']} (ID: {target_channel['id']})")
+        
+        if interactive:
+            # Show preview
+            print(f"\n📝 Summary preview:")
+            print("-" * 50)
+            print(summary_content[:500] + "..." if len(summary_content) > 500 else summary_content)
+            print("-" * 50)
+            
+            # Confirm posting
+            confirm = input(f"\nPost this summary to #{target_channel['name']}? (y/N): ").strip().lower()
+            if confirm not in ['y', 'yes']:
+                print("Cancelled.")
+                return None
+        
+        # Post 7-day date range first
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=7)
+        date_range = f"{start_date.strftime('%B %d')} - {end_date.strftime('%B %d, %Y')}"
+        print(f"📤 Posting date message to #{target_channel['name']}...")
+        
+        date_response = self.post_message(target_channel['id'], date_range)
+        thread_ts = date_response.get('ts')
+        
+        # Post the summary as a reply
+        print(f"📤 Posting summary as reply...")
+        self.post_reply(target_channel['id'], thread_ts, summary_content)
+        
+        return thread_ts
     
     def upload_file(self, channel_id, file_path, filename=None, initial_comment=None):
         try:
-            time.sleep(30)  # Rate limiting before API call
+            self.wait_for_rate_limit('files.upload')
             
             if filename is None:
                 filename = os.path.basename(file_path)
@@ -250,22 +377,72 @@ class TownCrierSlackClient:
             print(f"❌ Failed to upload file: {e.response['error']}")
             raise
     
+    def load_user_cache(self):
+        """Return (time users were last listed, {user_id: record}) from the disk cache"""
+        try:
+            cached = json_utils.load_file(USER_CACHE_PATH)
+            return cached['listed_at'], cached['users']
+        except (OSError, ValueError, KeyError):
+            return 0, {}
+    
+    def save_user_cache(self):
+        """Write the user cache to disk atomically; callers hold user_cache_lock"""
+        os.makedirs(os.path.dirname(USER_CACHE_PATH), exist_ok=True)
+        temp_path = f"{USER_CACHE_PATH}.{os.getpid()}.tmp"
+        json_utils.dump_file({'listed_at': self.users_listed_at, 'users': self.user_cache}, temp_path)
+        os.replace(temp_path, USER_CACHE_PATH)
+    
     def get_user_info(self, user_id):
+        # Each user is looked up at most once; results persist across runs
+        cached = self.user_cache.get(user_id)
+        if cached:
+            return cached
+        
         try:
-            time.sleep(30)  # Rate limiting before API call
-            response = self.client.users_info(user=user_id)
-            user = response['user']
-            return {
-                'id': user_id,
-                'name': user.get('name', 'Unknown'),
-                'real_name': user.get('real_name', 'Unknown'),
-                'display_name': user.get('profile', {}).get('display_name', ''),
-            }
+            response = self.call_api('users.info', user=user_id)
         except SlackApiError as e:
             print(f"⚠️ Failed to get user info for {user_id}: {e.response['error']}")
-            return {
-                'id': user_id,
-                'name': 'Unknown',
-                'real_name': 'Unknown',
-                'display_name': '',
-            }
\ No newline at end of file
+            return user_record(user_id, {})
+        
+        record = user_record(user_id, response['user'])
+        with self.user_cache_lock:
+            self.user_cache[user_id] = record
+            self.save_user_cache()
+        return record
+    
+    def prefetch_all_users(self, max_retries=3):
+        """Fetch every workspace user with paginated users.list calls, keyed by user ID"""
+        # Reuse the list from disk if it was fetched within the last USER_CACHE_TTL
+        if time.time() - self.users_listed_at < USER_CACHE_TTL:
+            print(f"Using {len(self.user_cache)} cached users from {USER_CACHE_PATH}")
+            return dict(self.user_cache)
+        
+        print("Prefetching workspace users...")
+        user_cache = {}
+        cursor = None
+        
+        while True:
+            params = {'limit': 1000}
+            if cursor:
+                params['cursor'] = cursor
+            
+            try:
+                response = self.call_api('users.list', max_retries, **params)
+            except SlackApiError as e:
+                print(f"❌ Failed to list users: {e.response['error']}")
+                raise
+            
+            for user in response['members']:
+                user_cache[user['id']] = user_record(user['id'], user)
+            
+            cursor = response.get('response_metadata', {}).get('next_cursor')
+            if not cursor:
+                break
+        
+        with self.user_cache_lock:
+            self.users_listed_at = time.time()
+            self.user_cache = dict(user_cache)
+            self.save_user_cache()
+        
+        print(f"Cached {len(user_cache)} users")
+        return user_cache
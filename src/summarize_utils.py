@@ -0,0 +1,234 @@
+import hashlib
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+from operator import itemgetter
+from src import json_utils
+from src.rate_limiter import RateLimiter
+
+# Model used for every channel summary
+CLAUDE_MODEL = "claude-sonnet-4-20250514"
+
+# Longest summary Claude may write
+CLAUDE_MAX_TOKENS = 1000
+
+# Channels that get summarized
+TARGET_CHANNEL_PREFIXES = ('lab-notes-', 'surface-area-')
+
+# Claude requests per minute, kept to about 80% of a Tier 1 account's limit
+CLAUDE_REQUESTS_PER_MINUTE = 40
+
+# Seconds to wait before each retry of a failed Claude request, doubling each time
+CLAUDE_RETRY_DELAYS = [2, 4, 8, 16]
+
+# Shared by all summarization workers
+claude_limiter = RateLimiter(CLAUDE_REQUESTS_PER_MINUTE)
+
+# Summaries are stored here by a hash of the model, prompt and channel messages, so
+# reruns over unchanged channels don't call Claude again
+SUMMARY_CACHE_DIR = os.path.join("cache", "summaries")
+
+def find_latest_messages_file(data_dir="data"):
+    """Path of the most recent collected messages file, or None (after saying why) if there is none"""
+    if not os.path.exists(data_dir):
+        print("❌ No data directory found. Run collect_messages.py first.")
+        return None
+    
+    # Collection writes an NDJSON copy next to each JSON file, and for the same run
+    # ".ndjson" compares greater than ".json", so the streamable copy is preferred
+    message_files = [f for f in os.listdir(data_dir) if f.startswith("messages_") and f.endswith((".json", ".ndjson"))]
+    if not message_files:
+        print("❌ No message files found in data directory")
+        return None
+    
+    return os.path.join(data_dir, max(message_files))
+
+def load_prompt():
+    """Load the summarization prompt from file"""
+    try:
+        with open('summarization_prompt.txt', 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        print("❌ summarization_prompt.txt not found")
+        return None
+
+@lru_cache(maxsize=8192)
+def format_minute(minute):
+    """Format a Unix time given in whole minutes; busy channels post many messages per minute"""
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(minute * 60))
+
+def timed_entries(entries, presorted=False):
+    """
+    (timestamp, entry) pairs for the entries with text, in chronological order.
+    `presorted` entries are already chronological, so they aren't sorted again.
+    """
+    timed = [(float(entry.get('timestamp', 0)), entry) for entry in entries if entry.get('text', '').strip()]
+    if not presorted:
+        timed.sort(key=itemgetter(0))
+    return timed
+
+def context_lines(messages, presorted=False):
+    """
+    Yield the context lines for a channel's messages, one thread at a time.
+    `presorted` messages are newest first with their replies oldest first, as
+    collection stores them when it has checked the order.
+    """
+    # Each timestamp is parsed once, and messages without text are dropped before sorting
+    if presorted:
+        messages = reversed(messages)
+    for ts, msg in timed_entries(messages, presorted):
+        # Main message, with its timestamp formatted for readability
+        user_name = msg.get('user_name', 'Unknown')
+        text = msg.get('text', '').strip()
+        yield f"[{format_minute(int(ts // 60))}] {user_name}: {text}"
+        
+        # Add replies if they exist, chronologically too
+        for reply_ts, reply in timed_entries(msg.get('replies', []), presorted):
+            reply_user = reply.get('user_name', 'Unknown')
+            reply_text = reply.get('text', '').strip()
+            yield f"  └─ [{format_minute(int(reply_ts // 60))}] {reply_user}: {reply_text}"
+        
+        # Add spacing between message threads
+        yield ""
+
+def prepare_channel_context(channel_data):
+    """
+    Prepare context for a single channel with messages in chronological order
+    and replies attached to their parent messages. Returns None if no message
+    has any text, since there is nothing to summarize.
+    """
+    messages = channel_data.get('messages', [])
+    if not messages:
+        return "No messages found in this channel."
+    
+    if not any((msg.get('text') or '').strip() for msg in messages):
+        return None
+    
+    return "\n".join(context_lines(messages, presorted=channel_data.get('sorted', False)))
+
+def summary_cache_path(prompt, context):
+    """Path of the cached summary for this prompt and channel context"""
+    request = f"{CLAUDE_MODEL}\n{prompt}\n\n---\n\nChannel messages:\n\n{context}"
+    cache_key = hashlib.sha256(request.encode('utf-8')).hexdigest()
+    return os.path.join(SUMMARY_CACHE_DIR, f"{cache_key}.txt")
+
+def load_cached_summary(prompt, context):
+    """Return the summary from an earlier run of this exact request, or None"""
+    try:
+        with open(summary_cache_path(prompt, context), 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def save_cached_summary(prompt, context, summary):
+    """Store a summary in the cache, via a temp file so entries are never truncated"""
+    os.makedirs(SUMMARY_CACHE_DIR, exist_ok=True)
+    cache_path = summary_cache_path(prompt, context)
+    temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(summary)
+    os.replace(temp_path, cache_path)
+
+def claude_request_params(prompt, context):
+    """Model, system prompt and messages of the request summarizing one channel's context"""
+    return {
+        "model": CLAUDE_MODEL,
+        "max_tokens": CLAUDE_MAX_TOKENS,
+        # The instructions are identical for every channel, so they go in a cached
+        # system block and only the channel's messages change between requests
+        "system": [{
+            "type": "text",
+            "text": prompt,
+            "cache_control": {"type": "ephemeral"}
+        }],
+        "messages": [{
+            "role": "user",
+            "content": f"Channel messages:\n\n{context}"
+        }]
+    }
+
+def call_claude(client, request):
+    """
+    Make a Claude API call with `request(client)`, retrying rate limits, overload, server
+    errors and dropped connections after CLAUDE_RETRY_DELAYS. Returns what `request()`
+    returns, or None once the call has failed for good.
+    """
+    # anthropic (and the httpx/pydantic stack behind it) is only imported by callers
+    # that actually talk to Claude
+    import anthropic
+    
+    # The retrying is done here, so turn off the SDK's own retries; otherwise each
+    # attempt could be several HTTP requests
+    client = client.with_options(max_retries=0)
+    
+    for attempt in range(len(CLAUDE_RETRY_DELAYS) + 1):
+        try:
+            return request(client)
+            
+        except (anthropic.APIStatusError, anthropic.APIConnectionError) as e:
+            # Rate limits, overload and server errors are transient; anything else
+            # (bad request, auth) would fail the same way again
+            status_code = getattr(e, 'status_code', None)
+            retryable = status_code is None or status_code == 429 or status_code >= 500
+            if not retryable or attempt == len(CLAUDE_RETRY_DELAYS):
+                print(f"❌ Error calling Claude API: {str(e)}")
+                return None
+            # Jitter keeps concurrent workers from retrying in lockstep, but never retry
+            # sooner than the API asked us to
+            retry_delay = CLAUDE_RETRY_DELAYS[attempt] * random.uniform(0.5, 1.5)
+            response = getattr(e, 'response', None)
+            try:
+                retry_delay = max(retry_delay, float(response.headers.get('retry-after', 0)))
+            except (AttributeError, ValueError):
+                pass
+            print(f"⏳ Claude request failed ({status_code or 'connection error'}), retrying in {retry_delay:.0f} seconds (attempt {attempt + 1}/{len(CLAUDE_RETRY_DELAYS)})...")
+            time.sleep(retry_delay)
+        except Exception as e:
+            print(f"❌ Error calling Claude API: {str(e)}")
+            return None
+
+def summarize_channel_with_claude(prompt, context, client, on_text=None):
+    """
+    Send the prompt and context to Claude for summarization. The response is streamed,
+    and each piece of text is passed to `on_text` (if given) as it arrives. Once any
+    text has been passed on, a failed stream is not retried, since that would repeat it.
+    """
+    def request(client):
+        claude_limiter.acquire()
+        with client.messages.stream(**claude_request_params(prompt, context)) as stream:
+            text_parts = []
+            try:
+                for text in stream.text_stream:
+                    text_parts.append(text)
+                    if on_text:
+                        on_text(text)
+            except Exception as e:
+                # Not one of the errors call_claude retries, so it gives up
+                if on_text and text_parts:
+                    raise RuntimeError(f"response interrupted: {e}") from e
+                raise
+        
+        return "".join(text_parts)
+    
+    return call_claude(client, request)
+
+def iter_channels(filepath, keep=None):
+    """
+    Yield (channel_name, channel_data) pairs from a messages file, skipping channels
+    whose name `keep(name)` rejects. NDJSON files are parsed one channel per line, and
+    rejected lines are never parsed; plain JSON files are loaded whole.
+    """
+    if filepath.endswith('.ndjson'):
+        with open(filepath, 'rb') as f:
+            for line in f:
+                # Each line is {"<channel name>":{...}}; Slack channel names never need
+                # escaping, so the name can be read without parsing the channel
+                channel_name = line[2:line.index(b'"', 2)].decode('utf-8')
+                if keep is None or keep(channel_name):
+                    yield channel_name, json_utils.loads(line)[channel_name]
+    else:
+        for channel_name, channel_data in json_utils.load_file(filepath).get('channels', {}).items():
+            if keep is None or keep(channel_name):
+                yield channel_name, channel_data
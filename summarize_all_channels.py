@@ -1,115 +1,70 @@
 #!/usr/bin/env python3
 
-import json
+import argparse
 import os
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
 import anthropic
+from src.summarize_utils import (
+    SUMMARY_CACHE_DIR, TARGET_CHANNEL_PREFIXES, claude_request_params, find_latest_messages_file,
+    iter_channels, load_cached_summary, load_prompt, prepare_channel_context, save_cached_summary,
+    summarize_channel_with_claude
+)
 
-def load_prompt():
-    """Load the summarization prompt from file"""
-    try:
-        with open('summarization_prompt.txt', 'r', encoding='utf-8') as f:
-            return f.read().strip()
-    except FileNotFoundError:
-        print("❌ summarization_prompt.txt not found")
-        return None
+# Number of channels summarized concurrently
+SUMMARY_WORKERS = 4
+
+# Seconds between status checks on a submitted message batch
+BATCH_POLL_SECONDS = 30
 
-def prepare_channel_context(channel_data):
+def summarize_channels_in_batch(prompt, contexts, client):
     """
-    Prepare context for a single channel with messages in chronological order
-    and replies attached to their parent messages
+    Summarize a list of channel contexts with one Message Batches API request, which
+    costs half as much as real-time calls but can take a while to finish. Returns a
+    summary (or None on failure) for each context, in the same order.
     """
-    messages = channel_data.get('messages', [])
-    if not messages:
-        return "No messages found in this channel."
-    
-    # Sort messages chronologically by timestamp
-    sorted_messages = sorted(messages, key=lambda x: float(x.get('timestamp', 0)))
-    
-    context_parts = []
+    summaries = [None] * len(contexts)
     
-    for msg in sorted_messages:
-        # Skip messages without text
-        if not msg.get('text', '').strip():
-            continue
-            
-        # Format timestamp for readability
-        ts = float(msg.get('timestamp', 0))
-        dt = datetime.fromtimestamp(ts)
-        timestamp_str = dt.strftime('%Y-%m-%d %H:%M')
-        
-        # Main message
-        user_name = msg.get('user_name', 'Unknown')
-        text = msg.get('text', '').strip()
-        
-        context_parts.append(f"[{timestamp_str}] {user_name}: {text}")
-        
-        # Add replies if they exist
-        replies = msg.get('replies', [])
-        if replies:
-            # Sort replies chronologically too
-            sorted_replies = sorted(replies, key=lambda x: float(x.get('timestamp', 0)))
-            
-            for reply in sorted_replies:
-                if not reply.get('text', '').strip():
-                    continue
-                    
-                reply_ts = float(reply.get('timestamp', 0))
-                reply_dt = datetime.fromtimestamp(reply_ts)
-                reply_timestamp_str = reply_dt.strftime('%Y-%m-%d %H:%M')
-                reply_user = reply.get('user_name', 'Unknown')
-                reply_text = reply.get('text', '').strip()
-                
-                context_parts.append(f"  └─ [{reply_timestamp_str}] {reply_user}: {reply_text}")
-        
-        # Add spacing between message threads
-        context_parts.append("")
-    
-    return "\n".join(context_parts)
-
-def summarize_channel_with_claude(prompt, context, client):
-    """Send the prompt and context to Claude for summarization"""
     try:
-        full_prompt = f"{prompt}\n\n---\n\nChannel messages:\n\n{context}"
+        # custom_id only allows [a-zA-Z0-9_-]{1,64}, so requests are keyed by position
+        # rather than by channel name
+        batch = client.messages.batches.create(requests=[
+            {
+                "custom_id": f"channel-{i}",
+                "params": claude_request_params(prompt, context)
+            }
+            for i, context in enumerate(contexts)
+        ])
+        print(f"📦 Submitted batch {batch.id} with {len(contexts)} requests")
         
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1000,
-            messages=[{
-                "role": "user",
-                "content": full_prompt
-            }]
-        )
+        while batch.processing_status != "ended":
+            time.sleep(BATCH_POLL_SECONDS)
+            batch = client.messages.batches.retrieve(batch.id)
+            counts = batch.request_counts
+            print(f"⏳ Batch {batch.processing_status}: {counts.processing} processing, {counts.succeeded} succeeded, {counts.errored} errored")
         
-        return response.content[0].text
+        for entry in client.messages.batches.results(batch.id):
+            index = int(entry.custom_id.split("-")[1])
+            if entry.result.type == "succeeded":
+                summaries[index] = entry.result.message.content[0].text
+            else:
+                print(f"❌ Batch request {entry.custom_id} {entry.result.type}")
         
     except Exception as e:
-        print(f"❌ Error calling Claude API: {str(e)}")
-        return None
+        print(f"❌ Error calling Claude Batches API: {str(e)}")
+    
+    return summaries
 
-def main():
-    # Find the most recent JSON file
-    data_dir = "data"
-    if not os.path.exists(data_dir):
-        print("❌ No data directory found. Run collect_messages.py first.")
-        return
-        
-    json_files = [f for f in os.listdir(data_dir) if f.startswith("messages_") and f.endswith(".json")]
-    if not json_files:
-        print("❌ No message files found in data directory")
+def main(realtime=False, use_cache=True, min_messages=1):
+    filepath = find_latest_messages_file()
+    if not filepath:
         return
     
-    latest_file = sorted(json_files)[-1]
-    filepath = os.path.join(data_dir, latest_file)
-    
     print(f"📂 Loading data from: {filepath}")
     
-    # Load the JSON data
-    with open(filepath, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
     # Set up Claude client
     load_dotenv()
     api_key = os.getenv('ANTHROPIC_API_KEY')
@@ -125,16 +80,17 @@ def main():
     if not prompt:
         return
     
-    # Find all lab-notes and surface-area channels
-    channels = data.get('channels', {})
+    # Find all lab-notes and surface-area channels. Channels are read one at a time and
+    # only these are kept, so other channels are never held in memory
+    channels = {}
     target_channels = []
     
-    for channel_name in channels.keys():
-        if channel_name.startswith('lab-notes-') or channel_name.startswith('surface-area-'):
-            channel_data = channels[channel_name]
-            # Skip channels with errors or no messages
-            if not channel_data.get('error') and channel_data.get('message_count', 0) > 0:
-                target_channels.append(channel_name)
+    lab_channels = iter_channels(filepath, keep=lambda name: name.startswith(TARGET_CHANNEL_PREFIXES))
+    for channel_name, channel_data in lab_channels:
+        # Skip channels with errors or no messages
+        if not channel_data.get('error') and channel_data.get('message_count', 0) > 0:
+            channels[channel_name] = channel_data
+            target_channels.append(channel_name)
     
     if not target_channels:
         print("❌ No accessible lab-notes or surface-area channels found with messages")
@@ -150,52 +106,119 @@ def main():
         reply_count = channel_data.get('thread_replies_count', 0)
         print(f"  - #{channel_name}: {message_count} messages + {reply_count} replies")
     
-    # Generate summaries for all channels
-    all_summaries = []
-    
-    for i, channel_name in enumerate(target_channels, 1):
-        print(f"\n🤖 [{i}/{len(target_channels)}] Summarizing #{channel_name}...")
+    # Channels with too few messages to be worth a Claude call get a one-line note
+    contexts = [None] * len(target_channels)
+    summaries = [None] * len(target_channels)
+    busy = []
+    for i, channel_name in enumerate(target_channels):
+        message_count = channels[channel_name].get('message_count', 0)
+        if message_count < min_messages:
+            summaries[i] = f"Quiet this week: {message_count} {'message' if message_count == 1 else 'messages'}"
+        else:
+            busy.append(i)
+    n_quiet = len(target_channels) - len(busy)
+    
+    # Building a context is pure CPU work, so big channels are prepared in parallel
+    # across processes rather than one after another
+    with ProcessPoolExecutor() as pool:
+        busy_contexts = pool.map(prepare_channel_context, [channels[target_channels[i]] for i in busy])
+        for i, context in zip(busy, busy_contexts):
+            if context is None:
+                # Only joins, file shares and other events without text; nothing to summarize
+                summaries[i] = "Quiet this week: no text messages"
+            contexts[i] = context
+    n_empty = len(busy) - sum(context is not None for context in contexts)
+    
+    if n_quiet:
+        print(f"\n🤫 {n_quiet} channels have fewer than {min_messages} messages and won't be sent to Claude")
+    if n_empty:
+        print(f"\n🤫 {n_empty} channels have no messages with text and won't be sent to Claude")
+    
+    # Reuse summaries of channels whose messages haven't changed since an earlier run
+    if use_cache:
+        for i, context in enumerate(contexts):
+            if context is not None:
+                summaries[i] = load_cached_summary(prompt, context)
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+    n_cached = len(target_channels) - n_quiet - n_empty - len(missing)
+    if n_cached:
+        print(f"\n♻️  Reusing {n_cached} cached summaries from {SUMMARY_CACHE_DIR}")
+    
+    # Summaries are written to a .tmp file as soon as each one (and every channel
+    # before it in the shuffled order) is ready, then renamed once the run finishes.
+    # Not .partial: that suffix is the pipeline's resumable step 2 output
+    os.makedirs("summaries", exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"summaries/summary_{timestamp}.txt"
+    partial_path = f"{filename}.tmp"
+    
+    missing_contexts = [contexts[i] for i in missing]
+    with ThreadPoolExecutor(max_workers=SUMMARY_WORKERS) as executor, \
+            open(partial_path, 'w', encoding='utf-8') as summary_file:
+        if not missing:
+            new_summaries = iter([])
+        elif realtime:
+            # Claude calls are independent and network-bound, so run several at once;
+            # results are taken in the shuffled channel order
+            print(f"\n🤖 Summarizing {len(missing)} channels ({SUMMARY_WORKERS} at a time)...")
+            futures = [executor.submit(summarize_channel_with_claude, prompt, context, client) for context in missing_contexts]
+            new_summaries = (future.result() for future in futures)
+        else:
+            # Nobody is waiting on this run, so trade latency for the batch discount
+            print(f"\n🤖 Summarizing {len(missing)} channels in one message batch...")
+            new_summaries = iter(summarize_channels_in_batch(prompt, missing_contexts, client))
         
-        channel_data = channels[channel_name]
-        context = prepare_channel_context(channel_data)
-        summary = summarize_channel_with_claude(prompt, context, client)
+        # Generate summaries for all channels
+        all_summaries = []
         
-        if summary:
-            # Clean up unnecessary newlines in the summary
-            cleaned_summary = "\n".join(line for line in summary.split('\n') if line.strip())
+        for i, channel_name in enumerate(target_channels, 1):
+            channel_data = channels[channel_name]
             
-            # Format channel name as clickable link
-            channel_id = channel_data.get('id')
-            channel_link = f"<#{channel_id}|{channel_name}>" if channel_id else f"#{channel_name}"
+            summary = summaries[i - 1]
+            if summary is None:
+                summary = next(new_summaries)
+                if summary:
+                    save_cached_summary(prompt, contexts[i - 1], summary)
             
-            # Format the summary with channel header
-            channel_summary = f"{channel_link}\n{cleaned_summary}"
-            all_summaries.append(channel_summary)
-            print(f"✅ Summary complete for #{channel_name}")
-        else:
-            print(f"❌ Failed to summarize #{channel_name}")
+            if summary:
+                # Clean up unnecessary newlines in the summary
+                cleaned_summary = "\n".join(line for line in summary.split('\n') if line.strip())
+                
+                # Format channel name as clickable link
+                channel_id = channel_data.get('id')
+                channel_link = f"<#{channel_id}|{channel_name}>" if channel_id else f"#{channel_name}"
+                
+                # Format the summary with channel header
+                channel_summary = f"{channel_link}\n{cleaned_summary}"
+                if all_summaries:
+                    summary_file.write("\n\n")
+                summary_file.write(channel_summary)
+                summary_file.flush()
+                all_summaries.append(channel_summary)
+                print(f"✅ [{i}/{len(target_channels)}] Summary complete for #{channel_name}")
+            else:
+                print(f"❌ [{i}/{len(target_channels)}] Failed to summarize #{channel_name}")
     
     # Create final output
     if all_summaries:
-        final_output = "\n\n".join(all_summaries)
+        os.replace(partial_path, filename)
         
         # Print to terminal
         print("\n" + "="*80)
-        print(final_output)
+        print("\n\n".join(all_summaries))
         print("="*80)
         
-        # Save to file
-        os.makedirs("summaries", exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"summaries/summary_{timestamp}.txt"
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(final_output)
-        
         print(f"\n💾 Summary saved to: {filename}")
         print(f"✅ Summarized {len(all_summaries)} channels successfully.")
     else:
+        os.remove(partial_path)
         print("❌ No summaries were generated")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Summarize every lab-notes and surface-area channel in the latest collection')
+    parser.add_argument('--realtime', action='store_true', help='Call Claude directly instead of through the (cheaper, slower) Message Batches API')
+    parser.add_argument('--no-cache', action='store_true', help='Summarize every channel again instead of reusing cached summaries')
+    parser.add_argument('--min-messages', type=int, default=1, help='Note channels with fewer messages as quiet instead of summarizing them (e.g. 5)')
+    args = parser.parse_args()
+    
+    main(realtime=args.realtime, use_cache=not args.no_cache, min_messages=args.min_messages)
\ No newline at end of file
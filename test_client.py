@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.slack_client import TownCrierSlackClient
 
+# Number of channels probed concurrently
+PROBE_WORKERS = 8
+
 def main():
     print("=== Testing TownCrier Slack Client ===\n")
     
@@ -19,18 +23,26 @@ def main():
     # Test getting history from each channel to find which one the bot is in
     if channels:
         print(f"\n3. Testing which channels the bot can access...")
-        for channel in channels:
-            try:
-                messages = client.get_channel_history(channel['id'], days=7)
-                print(f"✅ Bot has access to: {channel['name']} ({len(messages)} messages)")
-                if messages:
-                    print(f"   Latest message preview: {messages[0].get('text', 'No text')[:50]}...")
-                break  # Stop after finding the first accessible channel
-            except Exception as e:
-                if "not_in_channel" in str(e):
-                    print(f"❌ Bot not in: {channel['name']}")
-                else:
-                    print(f"❌ Error accessing {channel['name']}: {str(e)}")
+        # Probe every channel at once and report as each answers, so finding the
+        # accessible one doesn't wait on the channels listed before it
+        with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as executor:
+            futures = {executor.submit(client.get_channel_history, channel['id'], 7): channel for channel in channels}
+            for future in as_completed(futures):
+                channel = futures[future]
+                try:
+                    messages = future.result()
+                    print(f"✅ Bot has access to: {channel['name']} ({len(messages)} messages)")
+                    if messages:
+                        print(f"   Latest message preview: {messages[0].get('text', 'No text')[:50]}...")
+                    # Stop after finding the first accessible channel
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                except Exception as e:
+                    if "not_in_channel" in str(e):
+                        print(f"❌ Bot not in: {channel['name']}")
+                    else:
+                        print(f"❌ Error accessing {channel['name']}: {str(e)}")
     else:
         print("\n3. No lab channels found to test message history")
 
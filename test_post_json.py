@@ -1,9 +1,30 @@
 #!/usr/bin/env python3
 
-import json
 import os
+from src import json_utils
 from src.slack_client import TownCrierSlackClient
 
+# Channel the raw data is uploaded to
+TARGET_CHANNEL = 'slack-bot-workshop'
+
+# Channel name -> ID map saved between runs, so the channel list is only fetched on a miss
+# (kept out of data/, where every *.json is treated as a collection)
+CHANNEL_CACHE_PATH = os.path.join("cache", "channels.json")
+
+def find_channel_id(client, channel_name):
+    """Look up a public channel's ID, listing the workspace's channels only if it isn't cached"""
+    try:
+        channel_ids = json_utils.load_file(CHANNEL_CACHE_PATH)
+    except (FileNotFoundError, ValueError):
+        channel_ids = {}
+    
+    if channel_name not in channel_ids:
+        channel_ids = {channel['name']: channel['id'] for channel in client.list_public_channels()}
+        os.makedirs(os.path.dirname(CHANNEL_CACHE_PATH), exist_ok=True)
+        json_utils.dump_file(channel_ids, CHANNEL_CACHE_PATH)
+    
+    return channel_ids.get(channel_name)
+
 def upload_json_to_slack():
     print("=== TownCrier JSON File Uploader ===\n")
     
@@ -14,7 +35,7 @@ def upload_json_to_slack():
         print("❌ No JSON files found in data directory")
         return
     
-    latest_file = sorted(json_files)[-1]
+    latest_file = max(json_files)
     filepath = os.path.join(data_dir, latest_file)
     
     print(f"📂 Using file: {filepath}")
@@ -26,28 +47,19 @@ def upload_json_to_slack():
     print("Testing connection...")
     client.test_connection()
     
-    # Get all channels to find slack-bot-workshop
-    print("\nLooking for #slack-bot-workshop channel...")
+    # Find slack-bot-workshop
+    print(f"\nLooking for #{TARGET_CHANNEL} channel...")
     try:
-        response = client.client.conversations_list(
-            types="public_channel",
-            limit=200
-        )
-        
-        target_channel = None
-        for channel in response['channels']:
-            if channel['name'] == 'slack-bot-workshop':
-                target_channel = channel
-                break
+        channel_id = find_channel_id(client, TARGET_CHANNEL)
         
-        if not target_channel:
-            print("❌ Could not find #slack-bot-workshop channel")
+        if not channel_id:
+            print(f"❌ Could not find #{TARGET_CHANNEL} channel")
             print("Available channels:")
-            for channel in response['channels']:
-                print(f"  - #{channel['name']}")
+            for name in client.channels_by_name:
+                print(f"  - #{name}")
             return
         
-        print(f"✅ Found #{target_channel['name']} (ID: {target_channel['id']})")
+        print(f"✅ Found #{TARGET_CHANNEL} (ID: {channel_id})")
         
     except Exception as e:
         print(f"❌ Failed to get channels: {str(e)}")
@@ -56,23 +68,23 @@ def upload_json_to_slack():
     # Confirm upload
     file_size = os.path.getsize(filepath) / 1024  # KB
     print(f"\n📎 File: {latest_file} ({file_size:.1f} KB)")
-    print(f"📍 Target: #{target_channel['name']}")
+    print(f"📍 Target: #{TARGET_CHANNEL}")
     
-    confirm = input(f"\nUpload this JSON file to #{target_channel['name']}? (y/N): ").strip().lower()
+    confirm = input(f"\nUpload this JSON file to #{TARGET_CHANNEL}? (y/N): ").strip().lower()
     if confirm not in ['y', 'yes']:
         print("Cancelled.")
         return
     
     # Upload the file
-    print(f"\n📤 Uploading to #{target_channel['name']}...")
+    print(f"\n📤 Uploading to #{TARGET_CHANNEL}...")
     try:
         response = client.upload_file(
-            channel_id=target_channel['id'],
+            channel_id=channel_id,
             file_path=filepath,
             filename=latest_file,
             initial_comment="Hi! I'm not ready to make summaries yet, but here's the raw data from today's lab-notes scrape 😊 If you'd like to experiment with it, be my guest!"
         )
-        print(f"✅ Successfully uploaded {latest_file} to #{target_channel['name']}!")
+        print(f"✅ Successfully uploaded {latest_file} to #{TARGET_CHANNEL}!")
     except Exception as e:
         print(f"❌ Failed to upload file: {str(e)}")
 